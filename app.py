@@ -1,25 +1,155 @@
-import queue
 import threading
+import time
 import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, messagebox, simpledialog
 
 import cv2
 from PIL import Image, ImageTk
 
-from config import VIEWER_HEIGHT
+from config import (
+    EXPORT_WORKERS,
+    PLAYBACK_BUFFER_SIZE,
+    THUMBNAIL_HEIGHT,
+    VIEWER_HEIGHT,
+)
+from proxy import build_proxy
 from utils import VideoReader, process_video
 
+PROXY_POLL_INTERVAL = 200
+EXPORT_POLL_INTERVAL = 500
+
+
+class FrameBuffer:
+    def __init__(self, capacity: int = PLAYBACK_BUFFER_SIZE):
+        self.capacity = capacity
+        self.frames = deque()
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, frame_index, frame, stop_signal) -> bool:
+        with self.condition:
+            while len(self.frames) >= self.capacity:
+                if stop_signal.is_set():
+                    return False
+                self.condition.wait(0.1)
+            self.frames.append((frame_index, frame))
+            return True
+
+    def pop_latest(self, frame_index):
+        latest = None
+        with self.condition:
+            while self.frames and self.frames[0][0] <= frame_index:
+                latest = self.frames.popleft()
+            self.condition.notify_all()
+        return latest
+
+    def clear(self) -> None:
+        with self.condition:
+            self.frames.clear()
+            self.condition.notify_all()
+
+
+class ExportJob:
+    def __init__(
+        self,
+        source_path,
+        output_video_name,
+        base_output_dir,
+        start_frame,
+        end_frame,
+    ):
+        self.source_path = source_path
+        self.output_video_name = output_video_name
+        self.base_output_dir = base_output_dir
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.status = "queued"
+        self.frames_done = 0
+        self.total = max(end_frame - start_frame, 0)
+        self.start_time = None
+
+    def run(self):
+        if self.cancel_event.is_set():
+            self.status = "cancelled"
+            return
+        self.status = "running"
+        self.start_time = time.perf_counter()
+        video_reader = VideoReader(self.source_path)
+        try:
+            completed = process_video(
+                video_reader,
+                self.output_video_name,
+                self.base_output_dir,
+                self.start_frame,
+                self.end_frame,
+                progress=self.set_progress,
+                cancel_event=self.cancel_event,
+                verbose=False,
+            )
+            self.status = "done" if completed else "cancelled"
+        except Exception as e:
+            self.status = f"failed ({e})"
+        finally:
+            video_reader.release()
+
+    def set_progress(self, frames_done, total):
+        self.frames_done = frames_done
+        self.total = total
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+
+    def describe(self) -> str:
+        text = f"{self.output_video_name}: {self.status}"
+        if self.status != "running":
+            return text
+        elapsed = time.perf_counter() - self.start_time
+        fps = self.frames_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.frames_done
+        eta = f"{remaining / fps:.0f} s" if fps > 0 else "-"
+        return (
+            f"{text} {self.frames_done}/{self.total} "
+            f"({fps:.1f} frames/s, ETA {eta})"
+        )
+
 
 class VideoPlayerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Video Player with Frame Counter")
         self.vid_reader = None
+        self.source_reader = None
+        self.proxy_thread = None
+        self.proxy_job = None
+        self.proxy_stop = threading.Event()
+        self.proxy_progress = 0.0
+        self.proxy_result = None
+        self.thumbnail_photos = []
+        self.total_frames = 0
+        self.info_text = ""
+        self.export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS)
+        self.export_jobs = []
         self.playing = False
         self.stop_signal = threading.Event()
         self.video_thread = None
+        self.display_job = None
         self.start_frame = 0
-        self.queue = queue.Queue()
+        self.current_frame = 0
+        self.fps = 30.0
+        self.play_start_time = 0.0
+        self.play_start_frame = 0
+        self.last_displayed = None
+        self.buffer = FrameBuffer()
+        self.photo = None
+        self.canvas_image = None
         self.video_info_label = tk.Label(root, text="")
         self.video_info_label.pack(pady=10)
         self.btn_open = tk.Button(
@@ -28,6 +158,9 @@ class VideoPlayerApp:
         self.btn_open.pack(pady=10)
         self.canvas = tk.Canvas(root, bg="black")
         self.canvas.pack(pady=20)
+        self.timeline = tk.Canvas(root, bg="gray20", height=THUMBNAIL_HEIGHT)
+        self.timeline.pack()
+        self.timeline.bind("<Button-1>", self.on_timeline_click)
         self.label_frame_num = tk.Label(root, text="Frame: 0")
         self.label_frame_num.pack(pady=10)
         self.btn_start = tk.Button(
@@ -44,12 +177,25 @@ class VideoPlayerApp:
             root, text="Process & Save", command=self.process_and_save
         )
         self.btn_process_save.pack(pady=10)
+        self.export_list = tk.Listbox(root, width=80, height=5)
+        self.export_list.pack(pady=10)
+        self.btn_cancel_export = tk.Button(
+            root, text="Cancel Export", command=self.cancel_export
+        )
+        self.btn_cancel_export.pack(pady=10)
+        self.root.after(EXPORT_POLL_INTERVAL, self.update_export_list)
 
     def open_video(self):
         filepath = filedialog.askopenfilename()
         if not filepath:
             return
-        self.vid_reader = VideoReader(filepath)
+        self.stop_video()
+        self.stop_proxy()
+        self.source_reader = VideoReader(filepath)
+        self.vid_reader = self.source_reader
+        self.current_frame = 0
+        self.last_displayed = None
+        self.fps = self.vid_reader.get_fps() or 30.0
         original_width, original_height = self.vid_reader.get_size()
         aspect_ratio = original_width / original_height
         if original_height > VIEWER_HEIGHT:
@@ -60,58 +206,191 @@ class VideoPlayerApp:
             new_width = int(original_width)
         self.new_size = (new_width, new_height)
         self.canvas.config(width=new_width, height=new_height)
+        self.photo = ImageTk.PhotoImage(Image.new("RGB", self.new_size))
+        self.canvas.delete("all")
+        self.canvas_image = self.canvas.create_image(
+            0, 0, anchor=tk.NW, image=self.photo
+        )
+        self.timeline.config(width=new_width)
+        self.timeline.delete("all")
         video_name = self.vid_reader.get_name()
-        total_frames = self.vid_reader.get_frame_count()
-        info_text = f"Video: {video_name} | Total Frames: {total_frames}"
-        self.video_info_label["text"] = info_text
-        self.update_video()
+        self.total_frames = self.vid_reader.get_frame_count()
+        self.info_text = (
+            f"Video: {video_name} | Total Frames: {self.total_frames}"
+        )
+        self.video_info_label["text"] = self.info_text
+        self.show_frame(self.current_frame)
+        self.start_proxy(filepath)
+
+    def start_proxy(self, filepath):
+        self.proxy_stop.clear()
+        self.proxy_progress = 0.0
+        self.proxy_result = None
+        self.proxy_thread = threading.Thread(
+            target=self.build_proxy_in_background,
+            args=(filepath,),
+            daemon=True,
+        )
+        self.proxy_thread.start()
+        self.proxy_job = self.root.after(PROXY_POLL_INTERVAL, self.check_proxy)
+
+    def stop_proxy(self):
+        self.proxy_stop.set()
+        if self.proxy_job is not None:
+            self.root.after_cancel(self.proxy_job)
+            self.proxy_job = None
+        if self.proxy_thread and self.proxy_thread.is_alive():
+            self.proxy_thread.join()
+
+    def build_proxy_in_background(self, filepath):
+        def set_progress(progress):
+            self.proxy_progress = progress
+
+        self.proxy_result = build_proxy(
+            filepath,
+            self.new_size[1],
+            progress=set_progress,
+            stop_signal=self.proxy_stop,
+        )
+
+    def check_proxy(self):
+        self.proxy_job = None
+        if self.proxy_thread.is_alive():
+            self.video_info_label["text"] = (
+                f"{self.info_text} | Building proxy: "
+                f"{self.proxy_progress * 100:.0f}%"
+            )
+            self.proxy_job = self.root.after(
+                PROXY_POLL_INTERVAL, self.check_proxy
+            )
+            return
+
+        self.video_info_label["text"] = self.info_text
+        if self.proxy_result is None:
+            return
+        proxy_path, thumbnail_frames, thumbnails = self.proxy_result
+        if proxy_path != self.source_reader.path:
+            playing = bool(self.video_thread and self.video_thread.is_alive())
+            self.stop_video()
+            self.vid_reader = VideoReader(proxy_path)
+            if playing:
+                self.start_video()
+        self.draw_timeline(thumbnail_frames, thumbnails)
+
+    def draw_timeline(self, thumbnail_frames, thumbnails):
+        self.timeline.delete("all")
+        self.thumbnail_photos = []
+        if not thumbnails:
+            return
+        width = self.new_size[0]
+        thumbnail_width = max(1, width // len(thumbnails))
+        for i, thumbnail in enumerate(thumbnails):
+            thumbnail = cv2.resize(
+                thumbnail, (thumbnail_width, THUMBNAIL_HEIGHT)
+            )
+            photo = ImageTk.PhotoImage(
+                Image.fromarray(cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB))
+            )
+            self.thumbnail_photos.append(photo)
+            self.timeline.create_image(
+                i * thumbnail_width, 0, anchor=tk.NW, image=photo
+            )
+        self.timeline.create_line(
+            0, 0, 0, THUMBNAIL_HEIGHT, fill="red", width=2, tags="cursor"
+        )
+        self.update_timeline_cursor(self.current_frame)
+
+    def update_timeline_cursor(self, frame_index):
+        if not self.total_frames:
+            return
+        x = frame_index / self.total_frames * self.new_size[0]
+        self.timeline.coords("cursor", x, 0, x, THUMBNAIL_HEIGHT)
+
+    def on_timeline_click(self, event):
+        if not self.vid_reader or not self.total_frames:
+            return
+        self.stop_video()
+        frame_index = int(event.x / self.new_size[0] * self.total_frames)
+        self.current_frame = min(max(frame_index, 0), self.total_frames - 1)
+        self.show_frame(self.current_frame)
 
     def start_video(self):
         self.stop_video()
+        if not self.vid_reader:
+            return
         self.root.after(100, self._start_video_thread)
-        self.root.after(100, self.display_from_queue)
 
     def _start_video_thread(self):
         if not self.video_thread or not self.video_thread.is_alive():
             self.stop_signal.clear()
+            self.play_start_frame = self.current_frame
+            self.play_start_time = time.perf_counter()
             self.video_thread = threading.Thread(target=self.update_video)
             self.video_thread.start()
+            self.display_job = self.root.after(1, self.display_from_queue)
 
     def stop_video(self):
         self.stop_signal.set()
+        if self.display_job is not None:
+            self.root.after_cancel(self.display_job)
+            self.display_job = None
         if self.video_thread and self.video_thread.is_alive():
             self.video_thread.join()
+        self.buffer.clear()
+        if self.last_displayed is not None:
+            self.current_frame = self.last_displayed + 1
 
     def reset_video(self):
         new_start_frame = simpledialog.askinteger("Input", "Reset to frame:")
         if new_start_frame is not None:
+            self.stop_video()
             self.start_frame = new_start_frame
-            self.vid_reader.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            self.current_frame = self.start_frame
             self.label_frame_num["text"] = f"Frame: {self.start_frame}"
+            self.show_frame(self.current_frame)
+
+    def prepare_frame(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.new_size:
+            frame = cv2.resize(frame, self.new_size)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def show_frame(self, frame_index):
+        frame = self.vid_reader.get_frame(frame_index)
+        if frame is not None:
+            self.display_frame(frame_index, self.prepare_frame(frame))
+
+    def display_frame(self, frame_index, frame):
+        self.photo.paste(Image.fromarray(frame))
+        self.last_displayed = frame_index
+        self.label_frame_num["text"] = f"Frame: {frame_index + 1}"
+        self.update_timeline_cursor(frame_index)
 
     def update_video(self):
         if not self.vid_reader:
             return
-        while self.vid_reader.cap.isOpened() and not self.stop_signal.is_set():
-            ret, frame = self.vid_reader.cap.read()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame = cv2.resize(frame, self.new_size)
-                self.queue.put(frame)
-            else:
+        while not self.stop_signal.is_set():
+            frame = self.vid_reader.get_frame(self.current_frame)
+            if frame is None:
+                break
+            if not self.buffer.put(
+                self.current_frame, self.prepare_frame(frame), self.stop_signal
+            ):
                 break
+            self.current_frame += 1
 
     def display_from_queue(self):
-        try:
-            frame = self.queue.get_nowait()
-            self.photo = ImageTk.PhotoImage(image=Image.fromarray(frame))
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
-            self.label_frame_num[
-                "text"
-            ] = f"Frame: {int(self.vid_reader.get_current_frame())}"
-            self.root.after(1, self.display_from_queue)
-        except queue.Empty:
-            self.root.after(100, self.display_from_queue)
+        elapsed = time.perf_counter() - self.play_start_time
+        target_frame = self.play_start_frame + int(elapsed * self.fps)
+        item = self.buffer.pop_latest(target_frame)
+        if item is not None:
+            self.display_frame(*item)
+        elif not self.video_thread.is_alive() and not len(self.buffer):
+            self.display_job = None
+            return
+
+        next_time = (target_frame + 1 - self.play_start_frame) / self.fps
+        delay = max(1, int((next_time - elapsed) * 1000))
+        self.display_job = self.root.after(delay, self.display_from_queue)
 
     def process_and_save(self):
         output_video_name = simpledialog.askstring(
@@ -133,17 +412,31 @@ class VideoPlayerApp:
                 end_frame is not None,
             ]
         ):
-            threading.Thread(
-                target=process_video,
-                args=(
-                    self.vid_reader,
-                    output_video_name,
-                    base_output_dir,
-                    start_frame,
-                    end_frame,
-                ),
-            ).start()
-            messagebox.showinfo("Info", "Processing started!")
+            job = ExportJob(
+                self.source_reader.path,
+                output_video_name,
+                base_output_dir,
+                start_frame,
+                end_frame,
+            )
+            job.future = self.export_executor.submit(job.run)
+            self.export_jobs.append(job)
+            self.update_export_list(schedule=False)
+
+    def update_export_list(self, schedule=True):
+        selection = self.export_list.curselection()
+        self.export_list.delete(0, tk.END)
+        for job in self.export_jobs:
+            self.export_list.insert(tk.END, job.describe())
+        for index in selection:
+            self.export_list.selection_set(index)
+        if schedule:
+            self.root.after(EXPORT_POLL_INTERVAL, self.update_export_list)
+
+    def cancel_export(self):
+        for index in self.export_list.curselection():
+            self.export_jobs[index].cancel()
+        self.update_export_list(schedule=False)
 
 
 if __name__ == "__main__":
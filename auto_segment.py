@@ -0,0 +1,148 @@
+import argparse
+
+import cv2
+import numpy as np
+
+from proxy import load_proxy
+
+SCAN_HEIGHT = 90
+SCAN_STRIDE = 2
+THRESHOLD_MADS = 6.0
+MIN_ENERGY = 1.0
+MIN_SEGMENT_TIME = 0.5
+MERGE_GAP_TIME = 1.0
+
+
+def scan_motion(
+    video_path: str,
+    stride: int = SCAN_STRIDE,
+    height: int = SCAN_HEIGHT,
+):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot read video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    frame_indices = []
+    energy = []
+    previous = None
+    frame_index = 0
+    # grab() still decodes every frame; the stride only skips the colour
+    # conversion, resize and difference of the frames in between.
+    while cap.grab():
+        if frame_index % stride == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            width = max(1, round(gray.shape[1] * height / gray.shape[0]))
+            small = cv2.resize(
+                gray, (width, height), interpolation=cv2.INTER_AREA
+            ).astype(np.int16)
+            if previous is not None:
+                frame_indices.append(frame_index)
+                energy.append(np.abs(small - previous).mean())
+            previous = small
+        frame_index += 1
+    cap.release()
+    return np.array(frame_indices, dtype=int), np.array(energy), fps
+
+
+def find_segments(
+    frame_indices,
+    energy,
+    fps: float,
+    total_frames: int,
+    stride: int = SCAN_STRIDE,
+    threshold: float = None,
+    min_segment_time: float = MIN_SEGMENT_TIME,
+    merge_gap_time: float = MERGE_GAP_TIME,
+    padding_time: float = 0.0,
+):
+    if len(energy) == 0:
+        return []
+    if threshold is None:
+        # Median and MAD follow the static background, so a long session
+        # with a few swings still gets a sensible threshold.
+        median = np.median(energy)
+        mad = np.median(np.abs(energy - median))
+        threshold = max(median + THRESHOLD_MADS * mad, MIN_ENERGY)
+
+    active = np.concatenate([[False], energy > threshold, [False]])
+    changes = np.flatnonzero(active[1:] != active[:-1])
+    # Each energy value covers the stride of frames before its index.
+    runs = [
+        [int(frame_indices[start]) - stride, int(frame_indices[end - 1]) + 1]
+        for start, end in zip(changes[::2], changes[1::2])
+    ]
+
+    merged = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] <= merge_gap_time * fps:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    padding = int(padding_time * fps)
+    return [
+        (max(start - padding, 0), min(end + padding, total_frames))
+        for start, end in merged
+        if end - start >= min_segment_time * fps
+    ]
+
+
+def detect_segments(
+    video_path: str,
+    stride: int = SCAN_STRIDE,
+    threshold: float = None,
+    padding_time: float = 0.0,
+):
+    # The viewer's low-resolution proxy has the same frames and is much
+    # cheaper to decode; the scan downscales to SCAN_HEIGHT either way.
+    cached = load_proxy(video_path)
+    scan_path = video_path if cached is None else cached[0]
+    frame_indices, energy, fps = scan_motion(scan_path, stride)
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if len(frame_indices):
+        total_frames = max(total_frames, int(frame_indices[-1]) + 1)
+    return find_segments(
+        frame_indices,
+        energy,
+        fps,
+        total_frames,
+        stride=stride,
+        threshold=threshold,
+        padding_time=padding_time,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find motion segments in a video"
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, help="Input video path", required=True
+    )
+    parser.add_argument(
+        "-s",
+        "--stride",
+        type=int,
+        default=SCAN_STRIDE,
+        help="Only every n-th frame is compared during the scan",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=None,
+        help="Mean absolute frame difference that counts as motion; "
+        + "estimated from the video when omitted",
+    )
+    args = parser.parse_args()
+
+    for start_frame, end_frame in detect_segments(
+        args.input, args.stride, args.threshold
+    ):
+        print(f"{start_frame} {end_frame}")
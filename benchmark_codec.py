@@ -0,0 +1,117 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import INTERPOLATIONS, ImageFormat
+
+np.random.seed(0)
+
+# (label, codec, quality, subsampling)
+SETTINGS = [
+    ("jpg default", "jpg", None, None),
+    ("jpg q90 4:2:0", "jpg", 90, "420"),
+    ("jpg q85 4:2:0", "jpg", 85, "420"),
+    ("jpg q95 4:4:4", "jpg", 95, "444"),
+    ("webp q90", "webp", 90, None),
+    ("webp q80", "webp", 80, None),
+    ("png level 1", "png", 1, None),
+    ("png level 3", "png", 3, None),
+]
+
+
+def load_frames(video_path, num_frames):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot read video: {video_path}")
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def create_synthetic_frames(num_frames, width, height):
+    frames = []
+    for _ in range(num_frames):
+        frame = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        frames.append(cv2.GaussianBlur(frame, (15, 15), 0))
+    return frames
+
+
+def report(label, image_format, frames):
+    num_bytes = 0
+    start = time.perf_counter()
+    for frame in frames:
+        num_bytes += len(image_format.encode(frame))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label}: {num_bytes / len(frames) / 1024:.1f} KiB/frame, "
+        f"{len(frames) / elapsed:.1f} frames/s"
+    )
+
+
+def benchmark(frames, long_sides, interpolation):
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height}")
+    for long_side in long_sides:
+        print(f"long side: {long_side or 'original'}")
+        for label, codec, quality, subsampling in SETTINGS:
+            try:
+                image_format = ImageFormat(
+                    codec, quality, subsampling, long_side, interpolation
+                )
+            except ValueError as e:
+                print(f"{label}: skipped ({e})")
+                continue
+            report(label, image_format, frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark frame size and encoding speed per image codec"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        default=None,
+        help="Video whose first frames are encoded; synthetic 1080p frames "
+        + "when omitted",
+    )
+    parser.add_argument(
+        "-n", "--num_frames", type=int, default=50, help="Number of frames"
+    )
+    parser.add_argument(
+        "-l",
+        "--long_sides",
+        type=int,
+        nargs="+",
+        default=[0, 640],
+        help="Long sides to resize to before encoding; 0 keeps the original "
+        + "size",
+    )
+    parser.add_argument(
+        "--interpolation",
+        type=str,
+        choices=list(INTERPOLATIONS),
+        default="area",
+        help="Interpolation used for the resize",
+    )
+    args = parser.parse_args()
+
+    if args.input is None:
+        frames = create_synthetic_frames(args.num_frames, 1920, 1080)
+    else:
+        frames = load_frames(args.input, args.num_frames)
+    if not frames:
+        raise ValueError("No frames to encode")
+    benchmark(
+        frames,
+        [long_side or None for long_side in args.long_sides],
+        args.interpolation,
+    )
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from convert_to_yolo_format import convert_to_yolo_format
+
+random.seed(0)
+
+
+def create_synthetic_coco(
+    json_path, num_images, annotations_per_image, num_keypoints
+) -> None:
+    width, height = 1920, 1080
+    images = []
+    annotations = []
+    for image_id in range(1, num_images + 1):
+        images.append(
+            {
+                "id": image_id,
+                "file_name": f"frame_{image_id}.jpg",
+                "width": width,
+                "height": height,
+            }
+        )
+        for _ in range(annotations_per_image):
+            keypoints = []
+            for _ in range(num_keypoints):
+                keypoints += [
+                    random.randint(0, width),
+                    random.randint(0, height),
+                    2,
+                ]
+            annotations.append(
+                {
+                    "id": len(annotations) + 1,
+                    "image_id": image_id,
+                    "category_id": 1,
+                    "keypoints": keypoints,
+                }
+            )
+    random.shuffle(annotations)
+
+    with open(json_path, "w") as f:
+        json.dump({"images": images, "annotations": annotations}, f)
+
+
+def nested_scan_convert(json_path, output_dir, max_images) -> None:
+    with open(json_path) as f:
+        coco_data = json.load(f)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    for image_data in coco_data["images"][:max_images]:
+        image_id = image_data["id"]
+        image_name = image_data["file_name"]
+        image_width = image_data["width"]
+        image_height = image_data["height"]
+
+        keypoitns_list = []
+        for annotation in coco_data["annotations"]:
+            if annotation["image_id"] == image_id:
+                keypoitns_list.append(annotation["keypoints"])
+
+        if not keypoitns_list:
+            continue
+
+        annotation_file_name = os.path.splitext(image_name)[0] + ".txt"
+        annotation_file_path = os.path.join(output_dir, annotation_file_name)
+        with open(annotation_file_path, "w") as f:
+            for keypoints in keypoitns_list:
+                x_min = min(keypoints[0::3])
+                x_max = max(keypoints[0::3])
+                y_min = min(keypoints[1::3])
+                y_max = max(keypoints[1::3])
+
+                x_center = (x_min + x_max) / 2 / image_width
+                y_center = (y_min + y_max) / 2 / image_height
+                width = (x_max - x_min) / image_width
+                height = (y_max - y_min) / image_height
+
+                f.write(
+                    f"{0} {round(x_center, 6)} {round(y_center, 6)} "
+                    f"{round(width, 6)} {round(height, 6)} "
+                )
+
+                for i in range(0, len(keypoints), 3):
+                    x = round(keypoints[i] / image_width, 6)
+                    y = round(keypoints[i + 1] / image_height, 6)
+                    v = round(keypoints[i + 2], 6)
+                    f.write(f"{x} {y} {v} ")
+                f.write("\n")
+
+
+def benchmark(num_images, annotations_per_image, num_keypoints, nested_images):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        create_synthetic_coco(
+            json_path, num_images, annotations_per_image, num_keypoints
+        )
+        print(
+            f"Synthetic COCO: {num_images} images, "
+            f"{num_images * annotations_per_image} annotations, "
+            f"{os.path.getsize(json_path) / 1e6:.1f} MB"
+        )
+
+        start = time.perf_counter()
+        convert_to_yolo_format(json_path, os.path.join(tmp_dir, "indexed"))
+        indexed_time = time.perf_counter() - start
+        print(f"Indexed conversion: {indexed_time:.2f} s")
+
+        nested_images = min(nested_images, num_images)
+        start = time.perf_counter()
+        nested_scan_convert(
+            json_path, os.path.join(tmp_dir, "nested"), nested_images
+        )
+        nested_time = time.perf_counter() - start
+        estimated_time = nested_time * num_images / nested_images
+        print(
+            f"Nested scan: {nested_time:.2f} s for {nested_images} images, "
+            f"estimated {estimated_time:.1f} s for {num_images} images"
+        )
+        print(f"Speedup: {estimated_time / indexed_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark COCO to YOLO conversion"
+    )
+    parser.add_argument(
+        "-n",
+        "--num_images",
+        type=int,
+        default=100000,
+        help="Number of synthetic images",
+    )
+    parser.add_argument(
+        "-a",
+        "--annotations_per_image",
+        type=int,
+        default=1,
+        help="Annotations per image",
+    )
+    parser.add_argument(
+        "-k",
+        "--num_keypoints",
+        type=int,
+        default=3,
+        help="Keypoints per annotation",
+    )
+    parser.add_argument(
+        "--nested_images",
+        type=int,
+        default=500,
+        help="Images converted with the nested scan before extrapolating",
+    )
+    args = parser.parse_args()
+
+    benchmark(
+        args.num_images,
+        args.annotations_per_image,
+        args.num_keypoints,
+        args.nested_images,
+    )
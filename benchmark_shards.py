@@ -0,0 +1,121 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from create_dataset import create_dataset, create_shard_dataset
+from shards import ShardReader
+
+np.random.seed(0)
+
+
+def create_synthetic_pairs(images_dir, labels_dir, num_samples, size):
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    for i in range(num_samples):
+        image = np.random.randint(0, 256, (size, size, 3), dtype=np.uint8)
+        image = cv2.GaussianBlur(image, (9, 9), 0)
+        cv2.imwrite(os.path.join(images_dir, f"frame_{i}.jpg"), image)
+        with open(os.path.join(labels_dir, f"frame_{i}.txt"), "w") as f:
+            f.write("0 0.5 0.5 0.2 0.2 0.5 0.5 2 0.4 0.4 2 0.6 0.6 2\n")
+
+
+def read_directory(dataset_dir):
+    num_bytes = 0
+    num_samples = 0
+    images_dir = os.path.join(dataset_dir, "images", "train")
+    labels_dir = os.path.join(dataset_dir, "labels", "train")
+    for name in sorted(os.listdir(images_dir)):
+        with open(os.path.join(images_dir, name), "rb") as f:
+            num_bytes += len(f.read())
+        label_name = os.path.splitext(name)[0] + ".txt"
+        with open(os.path.join(labels_dir, label_name), "rb") as f:
+            num_bytes += len(f.read())
+        num_samples += 1
+    return num_samples, num_bytes
+
+
+def read_shards(dataset_dir):
+    num_bytes = 0
+    num_samples = 0
+    with ShardReader(os.path.join(dataset_dir, "train-*.tar")) as reader:
+        for _, files in reader:
+            num_bytes += sum(len(data) for data in files.values())
+            num_samples += 1
+    return num_samples, num_bytes
+
+
+def read_shards_random(dataset_dir):
+    num_bytes = 0
+    with ShardReader(os.path.join(dataset_dir, "train-*.tar")) as reader:
+        indices = list(range(len(reader)))
+        random.shuffle(indices)
+        for index in indices:
+            _, files = reader[index]
+            num_bytes += sum(len(data) for data in files.values())
+    return len(indices), num_bytes
+
+
+def report(name, read_fn, dataset_dir):
+    start = time.perf_counter()
+    num_samples, num_bytes = read_fn(dataset_dir)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name}: {num_samples / elapsed:.0f} samples/s, "
+        f"{num_bytes / elapsed / 1e6:.1f} MB/s"
+    )
+
+
+def benchmark(num_samples, size, shard_size, work_dir):
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        images_dir = os.path.join(tmp_dir, "images", "src")
+        labels_dir = os.path.join(tmp_dir, "labels", "src")
+        create_synthetic_pairs(images_dir, labels_dir, num_samples, size)
+
+        directory_dir = os.path.join(tmp_dir, "directory")
+        shards_dir = os.path.join(tmp_dir, "shards")
+        create_dataset(images_dir, labels_dir, directory_dir, 1.0)
+        create_shard_dataset(
+            images_dir, labels_dir, shards_dir, 1.0, shard_size
+        )
+
+        report("Directory layout", read_directory, directory_dir)
+        report("Shards (sequential)", read_shards, shards_dir)
+        report("Shards (random access)", read_shards_random, shards_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading a directory dataset against shards"
+    )
+    parser.add_argument(
+        "-n",
+        "--num_samples",
+        type=int,
+        default=10000,
+        help="Number of synthetic image and label pairs",
+    )
+    parser.add_argument(
+        "--size", type=int, default=640, help="Synthetic image size"
+    )
+    parser.add_argument(
+        "-s",
+        "--shard_size",
+        type=int,
+        default=1 << 28,
+        help="Maximum shard size in bytes",
+    )
+    parser.add_argument(
+        "-d",
+        "--work_dir",
+        type=str,
+        default=None,
+        help="Directory for the temporary datasets, e.g. on the NFS mount",
+    )
+    args = parser.parse_args()
+
+    benchmark(args.num_samples, args.size, args.shard_size, args.work_dir)
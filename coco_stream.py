@@ -0,0 +1,148 @@
+import json
+import re
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonArrayStream:
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON file")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(
+                f"Expected {char!r} at offset {self.pos}, "
+                f"got {self.buf[self.pos]!r}"
+            )
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {self.pos}")
+
+    def iter_object_items(self, keys):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            if self.peek() == "[":
+                for value in self.iter_array():
+                    if key in keys:
+                        yield key, value
+            else:
+                self.decode()
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' at offset {self.pos}")
+
+
+def iter_json_arrays(json_path, keys):
+    with open(json_path, encoding="utf-8") as f:
+        yield from JsonArrayStream(f).iter_object_items(set(keys))
+
+
+class CocoImageIndex:
+    def __init__(self):
+        self.ids = array("q")
+        self.widths = array("d")
+        self.heights = array("d")
+        self.names = bytearray()
+        self.name_offsets = array("Q", [0])
+        self.order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, image_data) -> None:
+        self.ids.append(image_data["id"])
+        self.widths.append(image_data["width"])
+        self.heights.append(image_data["height"])
+        self.names += image_data["file_name"].encode("utf-8")
+        self.name_offsets.append(len(self.names))
+
+    def finalize(self) -> None:
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        self.order = array("q", order.astype(np.int64).tobytes())
+        self.ids = array("q", ids[order].tobytes())
+
+    def positions(self, image_ids):
+        image_ids = np.asarray(image_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(image_ids), -1, dtype=np.int64)
+        sorted_ids = np.frombuffer(self.ids, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, image_ids)
+        positions[positions == len(sorted_ids)] = 0
+        return np.where(sorted_ids[positions] == image_ids, positions, -1)
+
+    def position(self, image_id) -> int:
+        position = bisect_left(self.ids, image_id)
+        if position < len(self.ids) and self.ids[position] == image_id:
+            return position
+        return -1
+
+    def get(self, position):
+        original = self.order[position]
+        name = self.names[
+            self.name_offsets[original] : self.name_offsets[original + 1]
+        ].decode("utf-8")
+        return name, self.widths[original], self.heights[original]
@@ -4,5 +4,15 @@ SAVE_IMG_EXTENSION = ".jpg"
 TMP_DIR = ".tmp"
 VIEWER_HEIGHT = 600
 IMG_DIR = "images"
+RESIZED_IMG_DIR = "images_resized"
 VIDEO_DIR = "videos"
 EXTRA_TIME = 0.3
+ENCODER_THREADS = 4
+FRAME_QUEUE_SIZE = 32
+FRAME_CACHE_BYTES = 512 * 1024 * 1024
+READAHEAD_FRAMES = 8
+PLAYBACK_BUFFER_SIZE = 16
+THUMBNAIL_COUNT = 20
+THUMBNAIL_HEIGHT = 48
+EXPORT_WORKERS = 2
+PROGRESS_INTERVAL = 0.5
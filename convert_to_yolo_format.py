@@ -1,57 +1,246 @@
 import argparse
+import glob
 import json
+import multiprocessing
 import os
+import shutil
+import time
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import numpy as np
 
-def convert_to_yolo_format(json_path, output_dir) -> None:
+from coco_stream import CocoImageIndex, iter_json_arrays
+from config import TMP_DIR
+
+LABEL_EXTENSION = ".txt"
+CLASS_ID = 0
+PRECISION = 6
+
+
+def index_annotations(annotations) -> dict:
+    keypoints_by_image = defaultdict(list)
+    for annotation in annotations:
+        keypoints_by_image[annotation["image_id"]].append(
+            annotation["keypoints"]
+        )
+    return keypoints_by_image
+
+
+def keypoints_to_yolo(keypoints_list, image_width, image_height):
+    keypoints = np.asarray(keypoints_list, dtype=np.float64)
+    keypoints = keypoints.reshape(len(keypoints_list), -1, 3)
+    xs = keypoints[:, :, 0]
+    ys = keypoints[:, :, 1]
+
+    x_min = xs.min(axis=1)
+    x_max = xs.max(axis=1)
+    y_min = ys.min(axis=1)
+    y_max = ys.max(axis=1)
+
+    bbox = np.stack(
+        [
+            (x_min + x_max) / 2 / image_width,
+            (y_min + y_max) / 2 / image_height,
+            (x_max - x_min) / image_width,
+            (y_max - y_min) / image_height,
+        ],
+        axis=1,
+    )
+
+    normalized = keypoints.copy()
+    normalized[:, :, 0] /= image_width
+    normalized[:, :, 1] /= image_height
+
+    return np.concatenate(
+        [bbox, normalized.reshape(len(keypoints_list), -1)], axis=1
+    )
+
+
+def format_yolo_rows(rows) -> str:
+    num_keypoints = (rows.shape[1] - 4) // 3
+    row_format = " ".join(
+        [str(CLASS_ID)]
+        + [f"%.{PRECISION}f"] * 4
+        + [f"%.{PRECISION}f %.{PRECISION}f %g"] * num_keypoints
+    )
+    return "".join(row_format % tuple(row) + "\n" for row in rows.tolist())
+
+
+def write_yolo_label(output_dir, image_name, rows) -> str:
+    annotation_file_name = os.path.splitext(image_name)[0] + LABEL_EXTENSION
+    annotation_file_path = os.path.join(output_dir, annotation_file_name)
+    with open(annotation_file_path, "w") as f:
+        f.write(format_yolo_rows(rows))
+    return annotation_file_path
+
+
+def convert_to_yolo_format(json_path, output_dir):
     with open(json_path) as f:
         coco_data = json.load(f)
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    keypoints_by_image = index_annotations(coco_data["annotations"])
+
+    num_labels = 0
     for image_data in coco_data["images"]:
-        image_id = image_data["id"]
-        image_name = image_data["file_name"]
-        image_width = image_data["width"]
-        image_height = image_data["height"]
-
-        keypoitns_list = []
-        for annotation in coco_data["annotations"]:
-            if annotation["image_id"] == image_id:
-                keypoints = annotation["keypoints"]
-                keypoitns_list.append(keypoints)
-
-        if not keypoitns_list:
+        keypoints_list = keypoints_by_image.get(image_data["id"])
+        if not keypoints_list:
             continue
 
-        annotation_file_name = os.path.splitext(image_name)[0] + ".txt"
-        annotation_file_path = os.path.join(output_dir, annotation_file_name)
-        with open(annotation_file_path, "w") as f:
-            for keypoints in keypoitns_list:
-                x_min = min(keypoints[0::3])
-                x_max = max(keypoints[0::3])
-                y_min = min(keypoints[1::3])
-                y_max = max(keypoints[1::3])
-
-                x_center = (x_min + x_max) / 2 / image_width
-                y_center = (y_min + y_max) / 2 / image_height
-                width = (x_max - x_min) / image_width
-                height = (y_max - y_min) / image_height
-
-                f.write(
-                    f"{0} {round(x_center, 6)} {round(y_center, 6)} \
-                        {round(width, 6)} {round(height, 6)} "
-                )
-
-                for i in range(0, len(keypoints), 3):
-                    x = round(keypoints[i] / image_width, 6)
-                    y = round(keypoints[i + 1] / image_height, 6)
-                    v = round(keypoints[i + 2], 6)
-                    f.write(f"{x} {y} {v} ")
-                f.write("\n")
+        rows = keypoints_to_yolo(
+            keypoints_list, image_data["width"], image_data["height"]
+        )
+        write_yolo_label(output_dir, image_data["file_name"], rows)
+        num_labels += 1
 
     print("Convert to YOLO format is done!")
+    return len(coco_data["images"]), num_labels
+
+
+def convert_to_yolo_format_streaming(json_path, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+
+    image_index = CocoImageIndex()
+    annotation_image_ids = array("q")
+    for key, item in iter_json_arrays(json_path, ("images", "annotations")):
+        if key == "images":
+            image_index.add(item)
+        else:
+            annotation_image_ids.append(item["image_id"])
+    image_index.finalize()
+
+    positions = image_index.positions(annotation_image_ids)
+    del annotation_image_ids
+    remaining = np.bincount(
+        positions[positions >= 0], minlength=len(image_index)
+    ).astype(np.int32)
+    del positions
+
+    num_labels = 0
+    pending = {}
+    for _, annotation in iter_json_arrays(json_path, ("annotations",)):
+        position = image_index.position(annotation["image_id"])
+        if position < 0:
+            continue
+
+        keypoints_list = pending.setdefault(position, [])
+        keypoints_list.append(annotation["keypoints"])
+        remaining[position] -= 1
+        if remaining[position]:
+            continue
+
+        image_name, image_width, image_height = image_index.get(position)
+        rows = keypoints_to_yolo(keypoints_list, image_width, image_height)
+        write_yolo_label(output_dir, image_name, rows)
+        del pending[position]
+        num_labels += 1
+
+    print("Convert to YOLO format is done!")
+    return len(image_index), num_labels
+
+
+def find_json_files(json_path):
+    if os.path.isdir(json_path):
+        return sorted(glob.glob(os.path.join(json_path, "*.json")))
+    if os.path.isfile(json_path):
+        return [json_path]
+    return sorted(glob.glob(json_path))
+
+
+def convert_json_file(json_path, tmp_dir, stream):
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    if stream:
+        num_images, num_labels = convert_to_yolo_format_streaming(
+            json_path, tmp_dir
+        )
+    else:
+        num_images, num_labels = convert_to_yolo_format(json_path, tmp_dir)
+    return num_images, num_labels, sorted(os.listdir(tmp_dir))
+
+
+def convert_json_files(json_paths, output_dir, workers=None, stream=False):
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_root = os.path.join(output_dir, TMP_DIR)
+    tmp_dirs = {
+        json_path: os.path.join(
+            tmp_root, f"{i}_{os.path.splitext(os.path.basename(json_path))[0]}"
+        )
+        for i, json_path in enumerate(json_paths)
+    }
+
+    start_time = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = {
+            executor.submit(
+                convert_json_file, json_path, tmp_dirs[json_path], stream
+            ): json_path
+            for json_path in json_paths
+        }
+        for future in as_completed(futures):
+            json_path = futures[future]
+            try:
+                results[json_path] = future.result()
+            except Exception as e:
+                print(f"Failed to convert {json_path}: {e}")
+    elapsed = time.perf_counter() - start_time
+
+    # Label files already in output_dir, e.g. from an earlier run, are
+    # replaced; only names produced twice in this run count as collisions.
+    owners = {}
+    num_overwritten = 0
+    num_committed = 0
+    total_images = 0
+    total_labels = 0
+    for json_path in json_paths:
+        tmp_dir = tmp_dirs[json_path]
+        if json_path not in results:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            continue
+
+        num_images, num_labels, label_names = results[json_path]
+        collisions = [name for name in label_names if name in owners]
+        if collisions:
+            print(
+                f"Skipped {json_path}: {len(collisions)} label file names "
+                f"collide with {owners[collisions[0]]} "
+                f"(e.g. {collisions[0]})"
+            )
+            shutil.rmtree(tmp_dir)
+            continue
+
+        for name in label_names:
+            owners[name] = json_path
+            output_path = os.path.join(output_dir, name)
+            if os.path.exists(output_path):
+                num_overwritten += 1
+            os.replace(os.path.join(tmp_dir, name), output_path)
+        shutil.rmtree(tmp_dir)
+        num_committed += 1
+        total_images += num_images
+        total_labels += num_labels
+
+    if os.path.isdir(tmp_root) and not os.listdir(tmp_root):
+        os.rmdir(tmp_root)
+
+    print(
+        f"Converted {num_committed}/{len(json_paths)} files, "
+        f"{total_images} images, {total_labels} labels in {elapsed:.2f} s "
+        f"({total_images / max(elapsed, 1e-9):.1f} images/s, "
+        f"{total_labels / max(elapsed, 1e-9):.1f} labels/s)"
+    )
+    if num_overwritten:
+        print(
+            f"Overwrote {num_overwritten} existing label files in "
+            f"{output_dir}"
+        )
 
 
 if __name__ == "__main__":
@@ -62,14 +251,31 @@ if __name__ == "__main__":
         "-j",
         "--json_path",
         required=True,
-        help="Path to COCO format JSON file",
+        help="Path to COCO format JSON file, directory of JSON files or glob",
     )
     parser.add_argument(
         "-o",
         "--output_dir",
         required=True,
-        help="Output directory for YOLO format files",
+        help="Output directory for YOLO format files; existing label "
+        + "files with the same names are overwritten",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Read the JSON file incrementally to keep memory usage low",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs)",
     )
     args = parser.parse_args()
 
-    convert_to_yolo_format(args.json_path, args.output_dir)
+    json_paths = find_json_files(args.json_path)
+    if not json_paths:
+        raise ValueError(f"No JSON files found: {args.json_path}")
+    convert_json_files(json_paths, args.output_dir, args.workers, args.stream)
@@ -1,20 +1,45 @@
 import argparse
+import hashlib
+import json
 import os
 import random
 import shutil
 
 from ruamel.yaml import YAML
 
+from dedup import dedup_paths
+from shards import INDEX_EXTENSION, SHARD_EXTENSION, SHARD_SIZE, ShardWriter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 random.seed(0)
 
+LINK_MODES = ["copy", "hardlink", "symlink", "reflink", "auto"]
+LINK_FALLBACKS = {
+    "copy": ["copy"],
+    "hardlink": ["hardlink", "copy"],
+    "symlink": ["symlink", "copy"],
+    "reflink": ["reflink", "copy"],
+    "auto": ["reflink", "hardlink", "copy"],
+}
+FICLONE = 0x40049409
+DATASET_FORMATS = ["dirs", "list", "shards"]
+SPLITS = ["train", "val"]
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
 
-def create_config(output_dir):
+def create_config(output_dir, train="images/train", val="images/val"):
     yaml = YAML()
     yaml.default_flow_style = False
     data = {
         "path": os.path.join("..", output_dir),
-        "train": "images/train",
-        "val": "images/val",
+        "train": train,
+        "val": val,
         "kpt_shape": [3, 3],
         "names": {0: "club_wood"},
     }
@@ -23,48 +48,359 @@ def create_config(output_dir):
         yaml.dump(data, outfile)
 
 
-def create_dataset(images_dir, labels_dir, output_dir, train_ratio) -> None:
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def reflink(src, dst) -> None:
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def symlink(src, dst) -> None:
+    os.symlink(os.path.abspath(src), dst)
+
+
+LINK_FUNCTIONS = {
+    "copy": shutil.copyfile,
+    "hardlink": os.link,
+    "symlink": symlink,
+    "reflink": reflink,
+}
+
+
+class FileLinker:
+    def __init__(self, link_mode: str = "copy"):
+        if link_mode not in LINK_FALLBACKS:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        self.link_mode = link_mode
+        self.modes = list(LINK_FALLBACKS[link_mode])
+
+    def link(self, src, dst_dir) -> str:
+        dst = os.path.join(dst_dir, os.path.basename(src))
+        if os.path.lexists(dst):
+            os.remove(dst)
+
+        while True:
+            mode = self.modes[0]
+            try:
+                LINK_FUNCTIONS[mode](src, dst)
+                return mode
+            except OSError as e:
+                if len(self.modes) == 1:
+                    raise
+                self.modes.pop(0)
+                print(f"{mode} failed ({e}), falling back to {self.modes[0]}")
+
+
+def file_hash(path) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def file_entry(path, use_hash=False) -> dict:
+    stat = os.stat(path)
+    entry = {
+        "path": path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+    if use_hash:
+        entry["hash"] = file_hash(path)
+    return entry
+
+
+def is_unchanged(entry, path, use_hash=False) -> bool:
+    stat = os.stat(path)
+    if entry["path"] != path or entry["size"] != stat.st_size:
+        return False
+    if entry["mtime"] == stat.st_mtime:
+        return True
+    if use_hash and entry.get("hash") == file_hash(path):
+        entry["mtime"] = stat.st_mtime
+        return True
+    return False
+
 
-    images_train_dir = os.path.join(output_dir, "images", "train")
-    images_val_dir = os.path.join(output_dir, "images", "val")
-    labels_train_dir = os.path.join(output_dir, "labels", "train")
-    labels_val_dir = os.path.join(output_dir, "labels", "val")
+def load_manifest(output_dir) -> dict:
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)["entries"]
 
-    if not os.path.exists(images_train_dir):
-        os.makedirs(images_train_dir)
-    if not os.path.exists(images_val_dir):
-        os.makedirs(images_val_dir)
-    if not os.path.exists(labels_train_dir):
-        os.makedirs(labels_train_dir)
-    if not os.path.exists(labels_val_dir):
-        os.makedirs(labels_val_dir)
 
-    labels = os.listdir(labels_dir)
-    random.shuffle(labels)
+def save_manifest(output_dir, entries) -> None:
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps({"version": MANIFEST_VERSION, "entries": entries}))
+    os.replace(tmp_path, manifest_path)
 
-    train_size = int(len(labels) * train_ratio)
-    train_labels = labels[:train_size]
-    val_labels = labels[train_size:]
 
-    for label in train_labels:
-        label_path = os.path.join(labels_dir, label)
-        image_path = os.path.join(
-            images_dir, os.path.splitext(label)[0] + ".jpg"
+def label_to_image_path(images_dir, label) -> str:
+    return os.path.join(images_dir, os.path.splitext(label)[0] + ".jpg")
+
+
+def dedup_labels(images_dir, labels, max_distance) -> list:
+    image_paths = [label_to_image_path(images_dir, label) for label in labels]
+    kept, duplicates = dedup_paths(image_paths, max_distance)
+    kept = set(kept)
+    print(f"Skipped {len(duplicates)} near-duplicate images")
+    return [
+        label
+        for label, image_path in zip(labels, image_paths)
+        if image_path in kept
+    ]
+
+
+def update_manifest(
+    images_dir,
+    labels_dir,
+    output_dir,
+    train_ratio,
+    use_hash=False,
+    dedup_distance=None,
+):
+    # Manifest paths are absolute; resolving the directories once keeps
+    # abspath out of the per-file loop.
+    images_dir = os.path.abspath(images_dir)
+    labels_dir = os.path.abspath(labels_dir)
+    entries = load_manifest(output_dir)
+    labels = sorted(os.listdir(labels_dir))
+    if dedup_distance is not None:
+        labels = dedup_labels(images_dir, labels, dedup_distance)
+    label_set = set(labels)
+
+    removed = {
+        label: entry
+        for label, entry in entries.items()
+        if label not in label_set
+    }
+    for label in removed:
+        del entries[label]
+
+    changed = []
+    new_labels = []
+    refreshed = False
+    images_prefix = os.path.join(images_dir, "")
+    labels_prefix = os.path.join(labels_dir, "")
+    for label in labels:
+        label_path = labels_prefix + label
+        image_path = images_prefix + os.path.splitext(label)[0] + ".jpg"
+        entry = entries.get(label)
+        if entry is None:
+            new_labels.append(label)
+            entries[label] = {
+                "image": file_entry(image_path, use_hash),
+                "label": file_entry(label_path, use_hash),
+            }
+        else:
+            mtimes = (entry["image"]["mtime"], entry["label"]["mtime"])
+            if not (
+                is_unchanged(entry["image"], image_path, use_hash)
+                and is_unchanged(entry["label"], label_path, use_hash)
+            ):
+                changed.append(label)
+                entry["image"] = file_entry(image_path, use_hash)
+                entry["label"] = file_entry(label_path, use_hash)
+            elif mtimes != (entry["image"]["mtime"], entry["label"]["mtime"]):
+                # Only the mtime moved and the hash matched.
+                refreshed = True
+
+    random.shuffle(new_labels)
+    num_train = sum(
+        1 for entry in entries.values() if entry.get("split") == "train"
+    )
+    train_size = max(0, int(len(entries) * train_ratio) - num_train)
+    for i, label in enumerate(new_labels):
+        entries[label]["split"] = "train" if i < train_size else "val"
+
+    print(
+        f"Added {len(new_labels)}, updated {len(changed)}, "
+        f"removed {len(removed)}, unchanged "
+        f"{len(entries) - len(new_labels) - len(changed)}"
+    )
+    modified = bool(new_labels or changed or removed or refreshed)
+    return entries, new_labels + changed, removed, modified
+
+
+def image_to_label_path(image_path) -> str:
+    images_part = f"{os.sep}images{os.sep}"
+    labels_part = f"{os.sep}labels{os.sep}"
+    label_path = labels_part.join(image_path.rsplit(images_part, 1))
+    return os.path.splitext(label_path)[0] + ".txt"
+
+
+def check_parallel_dirs(images_dir, labels_dir) -> None:
+    # Every manifest entry points into these two directories, so checking
+    # one name covers all of them.
+    image_path = label_to_image_path(os.path.abspath(images_dir), "x.txt")
+    label_path = os.path.join(os.path.abspath(labels_dir), "x.txt")
+    if image_to_label_path(image_path) != label_path:
+        raise ValueError(
+            f"{label_path} cannot be resolved from {image_path}; "
+            + "images and labels must be in parallel 'images' and "
+            + "'labels' directories"
         )
-        shutil.copy(image_path, images_train_dir)
-        shutil.copy(label_path, labels_train_dir)
 
-    for label in val_labels:
-        label_path = os.path.join(labels_dir, label)
-        image_path = os.path.join(
-            images_dir, os.path.splitext(label)[0] + ".jpg"
+
+def write_list_file(list_path, entries) -> None:
+    with open(list_path, "w") as f:
+        f.writelines(entry["image"]["path"] + "\n" for entry in entries)
+
+
+def create_list_dataset(
+    images_dir,
+    labels_dir,
+    output_dir,
+    train_ratio,
+    use_hash=False,
+    dedup_distance=None,
+):
+    check_parallel_dirs(images_dir, labels_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries, _, _, modified = update_manifest(
+        images_dir,
+        labels_dir,
+        output_dir,
+        train_ratio,
+        use_hash,
+        dedup_distance,
+    )
+
+    for split in SPLITS:
+        write_list_file(
+            os.path.join(output_dir, f"{split}.txt"),
+            [
+                entries[label]
+                for label in sorted(entries)
+                if entries[label]["split"] == split
+            ],
         )
-        shutil.copy(image_path, images_val_dir)
-        shutil.copy(label_path, labels_val_dir)
+
+    create_config(output_dir, train="train.txt", val="val.txt")
+    if modified:
+        save_manifest(output_dir, entries)
+    print("Create dataset is done!")
+
+
+def create_shard_dataset(
+    images_dir,
+    labels_dir,
+    output_dir,
+    train_ratio,
+    shard_size=SHARD_SIZE,
+    use_hash=False,
+    dedup_distance=None,
+) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries, _, _, modified = update_manifest(
+        images_dir,
+        labels_dir,
+        output_dir,
+        train_ratio,
+        use_hash,
+        dedup_distance,
+    )
+
+    for split in SPLITS:
+        for name in os.listdir(output_dir):
+            if name.startswith(f"{split}-") and name.endswith(
+                (SHARD_EXTENSION, INDEX_EXTENSION)
+            ):
+                os.remove(os.path.join(output_dir, name))
+
+        with ShardWriter(output_dir, split, shard_size) as writer:
+            for label in sorted(entries):
+                entry = entries[label]
+                if entry["split"] != split:
+                    continue
+                writer.write(
+                    os.path.splitext(label)[0],
+                    {
+                        ".jpg": entry["image"]["path"],
+                        ".txt": entry["label"]["path"],
+                    },
+                )
+        print(f"{split}: {len(writer.shard_paths)} shards")
+
+    if modified:
+        save_manifest(output_dir, entries)
+    print("Create dataset is done!")
+
+
+def create_dataset(
+    images_dir,
+    labels_dir,
+    output_dir,
+    train_ratio,
+    link_mode="copy",
+    use_hash=False,
+    dedup_distance=None,
+) -> None:
+    split_dirs = {}
+    for split in SPLITS:
+        split_dirs[split] = (
+            os.path.join(output_dir, "images", split),
+            os.path.join(output_dir, "labels", split),
+        )
+        for split_dir in split_dirs[split]:
+            os.makedirs(split_dir, exist_ok=True)
+
+    entries, changed, _, modified = update_manifest(
+        images_dir,
+        labels_dir,
+        output_dir,
+        train_ratio,
+        use_hash,
+        dedup_distance,
+    )
+
+    # Anything the manifest does not assign to a split is removed, including
+    # copies left by a run that predates the manifest, so no image ends up
+    # in both train and val.
+    for split, (images_split_dir, labels_split_dir) in split_dirs.items():
+        expected_images = set()
+        expected_labels = set()
+        for entry in entries.values():
+            if entry["split"] == split:
+                expected_images.add(os.path.basename(entry["image"]["path"]))
+                expected_labels.add(os.path.basename(entry["label"]["path"]))
+        for split_dir, expected in (
+            (images_split_dir, expected_images),
+            (labels_split_dir, expected_labels),
+        ):
+            for name in os.listdir(split_dir):
+                if name not in expected:
+                    os.remove(os.path.join(split_dir, name))
+
+    changed = set(changed)
+    for label, entry in entries.items():
+        images_split_dir, _ = split_dirs[entry["split"]]
+        image_name = os.path.basename(entry["image"]["path"])
+        if not os.path.lexists(os.path.join(images_split_dir, image_name)):
+            changed.add(label)
+
+    linker = FileLinker(link_mode)
+
+    for label in sorted(changed):
+        entry = entries[label]
+        images_split_dir, labels_split_dir = split_dirs[entry["split"]]
+        linker.link(entry["image"]["path"], images_split_dir)
+        linker.link(entry["label"]["path"], labels_split_dir)
 
     create_config(output_dir)
+    if modified:
+        save_manifest(output_dir, entries)
     print("Create dataset is done!")
 
 
@@ -98,11 +434,74 @@ if __name__ == "__main__":
         default=0.9,
         help="Train ratio",
     )
+    parser.add_argument(
+        "-m",
+        "--link-mode",
+        type=str,
+        choices=LINK_MODES,
+        default="copy",
+        help="How to place files in the dataset; falls back to copy "
+        + "when the filesystem does not support the requested mode",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        choices=DATASET_FORMATS,
+        default="dirs",
+        help="'dirs' places files under images/ and labels/, 'list' "
+        + "only writes train.txt and val.txt with absolute image paths, "
+        + "'shards' packs image and label pairs into indexed tar shards",
+    )
+    parser.add_argument(
+        "-s",
+        "--shard_size",
+        type=int,
+        default=SHARD_SIZE,
+        help="Maximum shard size in bytes for the 'shards' format",
+    )
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Store content hashes in the manifest so that files whose "
+        + "mtime changed but content did not are not placed again",
+    )
+    parser.add_argument(
+        "-d",
+        "--dedup",
+        type=int,
+        default=None,
+        help="Leave out images whose perceptual hash is within this "
+        + "Hamming distance of an image already in the dataset",
+    )
     args = parser.parse_args()
 
-    create_dataset(
-        args.images_dir,
-        args.labels_dir,
-        args.output_dir,
-        args.train_ratio,
-    )
+    if args.format == "list":
+        create_list_dataset(
+            args.images_dir,
+            args.labels_dir,
+            args.output_dir,
+            args.train_ratio,
+            args.hash,
+            args.dedup,
+        )
+    elif args.format == "shards":
+        create_shard_dataset(
+            args.images_dir,
+            args.labels_dir,
+            args.output_dir,
+            args.train_ratio,
+            args.shard_size,
+            args.hash,
+            args.dedup,
+        )
+    else:
+        create_dataset(
+            args.images_dir,
+            args.labels_dir,
+            args.output_dir,
+            args.train_ratio,
+            args.link_mode,
+            args.hash,
+            args.dedup,
+        )
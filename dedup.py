@@ -0,0 +1,296 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import ENCODER_THREADS
+
+HASH_METHODS = ["dhash", "phash"]
+HASH_CACHE_NAME = ".hashes.json"
+HASH_CACHE_VERSION = 1
+HASH_BATCH_SIZE = 256
+DEDUP_DISTANCE = 6
+HASH_INDEX_BLOCKS = 4
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# (width, height) each method downscales to before hashing.
+HASH_SIZES = {"dhash": (9, 8), "phash": (32, 32)}
+
+
+def dct_matrix(size: int):
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= np.sqrt(1 / size)
+    matrix[1:] *= np.sqrt(2 / size)
+    return matrix.astype(np.float32)
+
+
+DCT_MATRIX = dct_matrix(HASH_SIZES["phash"][0])
+
+
+def pack_hashes(bits) -> list:
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def dhash_batch(images) -> list:
+    return pack_hashes(images[:, :, 1:] > images[:, :, :-1])
+
+
+def phash_batch(images) -> list:
+    coeffs = DCT_MATRIX @ images @ DCT_MATRIX.T
+    low = coeffs[:, :8, :8].reshape(len(images), -1)
+    median = np.median(low[:, 1:], axis=1)
+    return pack_hashes(low > median[:, None])
+
+
+HASH_FUNCTIONS = {"dhash": dhash_batch, "phash": phash_batch}
+
+
+def to_hash_input(gray, method: str):
+    return cv2.resize(gray, HASH_SIZES[method], interpolation=cv2.INTER_AREA)
+
+
+def load_hash_input(path, method: str):
+    # JPEG decoding at 1/4 scale is far cheaper than a full decode and the
+    # hash only needs a few dozen pixels.
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        raise ValueError(f"Cannot read image: {path}")
+    return to_hash_input(image, method)
+
+
+def hash_frames(frames, method: str = "dhash") -> list:
+    if not frames:
+        return []
+    images = []
+    for frame in frames:
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        images.append(to_hash_input(frame, method))
+    return HASH_FUNCTIONS[method](np.stack(images).astype(np.float32))
+
+
+def load_hash_cache(directory) -> dict:
+    cache_path = os.path.join(directory, HASH_CACHE_NAME)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+            if cache.get("version") == HASH_CACHE_VERSION:
+                return cache
+        except (OSError, ValueError):
+            pass
+    return {"version": HASH_CACHE_VERSION}
+
+
+def save_hash_cache(directory, cache) -> None:
+    cache_path = os.path.join(directory, HASH_CACHE_NAME)
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def hash_files(
+    paths,
+    method: str = "dhash",
+    num_workers: int = ENCODER_THREADS,
+    batch_size: int = HASH_BATCH_SIZE,
+) -> list:
+    if method not in HASH_FUNCTIONS:
+        raise ValueError(f"Unknown hash method: {method}")
+
+    hashes = [None] * len(paths)
+    by_dir = {}
+    for i, path in enumerate(paths):
+        by_dir.setdefault(os.path.dirname(path), []).append(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        for directory, indices in by_dir.items():
+            cache = load_hash_cache(directory)
+            entries = cache.setdefault(method, {})
+            missing = []
+            for i in indices:
+                stat = os.stat(paths[i])
+                name = os.path.basename(paths[i])
+                entry = entries.get(name)
+                if (
+                    entry is not None
+                    and entry[0] == stat.st_size
+                    and entry[1] == stat.st_mtime
+                ):
+                    hashes[i] = entry[2]
+                else:
+                    missing.append((i, name, stat))
+
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start : start + batch_size]
+                batch_paths = [paths[i] for i, _, _ in batch]
+                images = np.stack(
+                    list(
+                        executor.map(
+                            load_hash_input,
+                            batch_paths,
+                            [method] * len(batch),
+                        )
+                    )
+                )
+                batch_hashes = HASH_FUNCTIONS[method](
+                    images.astype(np.float32)
+                )
+                for (i, name, stat), value in zip(batch, batch_hashes):
+                    hashes[i] = value
+                    entries[name] = [stat.st_size, stat.st_mtime, value]
+
+            if missing:
+                save_hash_cache(directory, cache)
+    return hashes
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    # Multi-index hashing: the hash is split into blocks, and two hashes
+    # within max_distance of each other must be within
+    # max_distance // num_blocks on at least one block. Each block is looked
+    # up with all of its variants within that radius and the candidates are
+    # verified, so queries are exact without comparing against every hash.
+    def __init__(
+        self,
+        max_distance: int = DEDUP_DISTANCE,
+        bits: int = 64,
+        num_blocks: int = HASH_INDEX_BLOCKS,
+    ):
+        self.max_distance = max_distance
+        block_bits = -(-bits // num_blocks)
+        self.blocks = [
+            (start, (1 << min(block_bits, bits - start)) - 1)
+            for start in range(0, bits, block_bits)
+        ]
+        radius = max_distance // len(self.blocks)
+        self.flips = [
+            sum(1 << position for position in positions)
+            for num_bits in range(radius + 1)
+            for positions in itertools.combinations(
+                range(block_bits), num_bits
+            )
+        ]
+        self.tables = [{} for _ in self.blocks]
+        self.values = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value: int, item=None) -> None:
+        position = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            table.setdefault((value >> shift) & mask, []).append(position)
+
+    def query(self, value: int, max_distance: int = None) -> list:
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(
+                f"Index was built for distances up to {self.max_distance}"
+            )
+        candidates = set()
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            key = (value >> shift) & mask
+            for flip in self.flips:
+                bucket = table.get(key ^ flip)
+                if bucket is not None:
+                    candidates.update(bucket)
+        matches = []
+        for position in candidates:
+            distance = hamming_distance(value, self.values[position])
+            if distance <= max_distance:
+                matches.append((distance, position, self.items[position]))
+        return [(distance, item) for distance, _, item in sorted(matches)]
+
+
+def find_duplicates(hashes, max_distance: int = DEDUP_DISTANCE) -> dict:
+    index = HashIndex(max_distance)
+    duplicates = {}
+    for i, value in enumerate(hashes):
+        matches = index.query(value)
+        if matches:
+            duplicates[i] = matches[0][1]
+        else:
+            index.add(value, i)
+    return duplicates
+
+
+def dedup_paths(
+    paths,
+    max_distance: int = DEDUP_DISTANCE,
+    method: str = "dhash",
+    num_workers: int = ENCODER_THREADS,
+):
+    hashes = hash_files(paths, method, num_workers)
+    duplicates = find_duplicates(hashes, max_distance)
+    kept = [path for i, path in enumerate(paths) if i not in duplicates]
+    return kept, {paths[i]: paths[j] for i, j in duplicates.items()}
+
+
+def find_images(image_dir):
+    return sorted(
+        os.path.join(image_dir, file)
+        for file in os.listdir(image_dir)
+        if file.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate images with perceptual hashes"
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, required=True, help="Image directory"
+    )
+    parser.add_argument(
+        "-d",
+        "--distance",
+        type=int,
+        default=DEDUP_DISTANCE,
+        help="Maximum Hamming distance between 64-bit hashes of "
+        + "near-duplicate images",
+    )
+    parser.add_argument(
+        "-m", "--method", type=str, choices=HASH_METHODS, default="dhash"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=ENCODER_THREADS,
+        help="Number of image decoding threads",
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete the duplicates instead of only listing them",
+    )
+    args = parser.parse_args()
+
+    paths = find_images(args.input)
+    kept, duplicates = dedup_paths(
+        paths, args.distance, args.method, args.workers
+    )
+    for duplicate, original in duplicates.items():
+        print(f"{duplicate} -> {original}")
+        if args.delete:
+            os.remove(duplicate)
+    print(f"Kept {len(kept)}, duplicates {len(duplicates)}")
@@ -1,6 +1,12 @@
 import argparse
 
+from auto_segment import detect_segments
 from config import EXTRA_TIME
+from pipeline import (
+    ImageFormat,
+    add_image_format_arguments,
+    image_format_from_args,
+)
 from utils import VideoReader, process_video
 
 
@@ -12,8 +18,10 @@ def extract_frames(
     end_time: float = None,
     rotate_direction: str = "none",
     fps: float = None,
+    image_format: ImageFormat = None,
 ):
     video_reader = VideoReader(input_path)
+    use_index = fps is None
     if fps is None:
         fps = video_reader.get_fps()
     print(f"FPS: {fps}")
@@ -23,8 +31,12 @@ def extract_frames(
     if end_time is None:
         end_time = total_frames / fps
 
-    start_frame = int((start_time - EXTRA_TIME) * fps)
-    end_frame = int((end_time + EXTRA_TIME) * fps)
+    if use_index:
+        start_frame = video_reader.time_to_frame(start_time - EXTRA_TIME)
+        end_frame = video_reader.time_to_frame(end_time + EXTRA_TIME)
+    else:
+        start_frame = int((start_time - EXTRA_TIME) * fps)
+        end_frame = int((end_time + EXTRA_TIME) * fps)
 
     print(f"Start frame: {start_frame}")
     print(f"End frame: {end_frame}")
@@ -36,9 +48,34 @@ def extract_frames(
         start_frame,
         end_frame,
         rotate_direction,
+        image_format=image_format,
     )
 
 
+def extract_auto_segments(
+    input_path: str,
+    output_dir: str,
+    video_name: str,
+    rotate_direction: str = "none",
+    image_format: ImageFormat = None,
+):
+    segments = detect_segments(input_path, padding_time=EXTRA_TIME)
+    print(f"Segments: {segments}")
+
+    video_reader = VideoReader(input_path)
+    for i, (start_frame, end_frame) in enumerate(segments):
+        process_video(
+            video_reader,
+            f"{video_name}_{i + 1}",
+            output_dir,
+            start_frame,
+            end_frame,
+            rotate_direction,
+            image_format=image_format,
+        )
+    video_reader.release()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Video frame extraction script"
@@ -78,6 +115,14 @@ if __name__ == "__main__":
         default=None,
         help="FPS of output video",
     )
+    parser.add_argument(
+        "-a",
+        "--auto",
+        action="store_true",
+        help="Detect swing segments from motion instead of using "
+        + "--start and --end; each segment is saved as <name>_<n>",
+    )
+    add_image_format_arguments(parser)
 
     args = parser.parse_args()
 
@@ -88,13 +133,20 @@ if __name__ == "__main__":
     end_time = args.end
     rotate_direction = args.rotate
     fps = args.fps
+    image_format = image_format_from_args(args)
 
-    extract_frames(
-        input_path,
-        output_dir,
-        video_name,
-        start_time,
-        end_time,
-        rotate_direction,
-        fps,
-    )
+    if args.auto:
+        extract_auto_segments(
+            input_path, output_dir, video_name, rotate_direction, image_format
+        )
+    else:
+        extract_frames(
+            input_path,
+            output_dir,
+            video_name,
+            start_time,
+            end_time,
+            rotate_direction,
+            fps,
+            image_format,
+        )
@@ -0,0 +1,99 @@
+import os
+
+import cv2
+import numpy as np
+
+from npz_cache import atomic_savez
+
+INDEX_SUFFIX = ".frameidx.npz"
+INDEX_VERSION = 1
+PTS_TOLERANCE_MSEC = 0.5
+
+
+def get_index_path(video_path) -> str:
+    return video_path + INDEX_SUFFIX
+
+
+def read_packets(video_path):
+    cap = cv2.VideoCapture(
+        video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1]
+    )
+    raw = cap.isOpened()
+    if not raw:
+        cap = cv2.VideoCapture(video_path)
+
+    pts_msec = []
+    keyframes = []
+    while cap.grab():
+        pts_msec.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        keyframes.append(
+            bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)) if raw else True
+        )
+    cap.release()
+    return np.array(pts_msec), np.array(keyframes, dtype=bool)
+
+
+class FrameIndex:
+    def __init__(self, pts_msec, keyframes):
+        order = np.argsort(pts_msec, kind="stable")
+        self.pts_msec = np.asarray(pts_msec, dtype=np.float64)[order]
+        self.keyframes = np.asarray(keyframes, dtype=bool)[order]
+        if len(self.keyframes):
+            self.keyframes[0] = True
+        key_positions = np.where(self.keyframes, np.arange(len(self)), 0)
+        self.keyframe_for = np.maximum.accumulate(key_positions)
+
+    def __len__(self):
+        return len(self.pts_msec)
+
+    @classmethod
+    def build(cls, video_path):
+        return cls(*read_packets(video_path))
+
+    @classmethod
+    def load_or_build(cls, video_path):
+        stat = os.stat(video_path)
+        index_path = get_index_path(video_path)
+        if os.path.exists(index_path):
+            try:
+                with np.load(index_path) as data:
+                    if (
+                        int(data["version"]) == INDEX_VERSION
+                        and int(data["size"]) == stat.st_size
+                        and float(data["mtime"]) == stat.st_mtime
+                    ):
+                        return cls(data["pts_msec"], data["keyframes"])
+            except Exception:
+                # A truncated or corrupt cache is rebuilt like a stale one.
+                pass
+
+        frame_index = cls.build(video_path)
+        # The GUI and export threads may build the same index at once.
+        try:
+            atomic_savez(
+                index_path,
+                version=INDEX_VERSION,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                pts_msec=frame_index.pts_msec,
+                keyframes=frame_index.keyframes,
+            )
+        except OSError:
+            pass
+        return frame_index
+
+    def clip(self, frame: int) -> int:
+        return min(max(int(frame), 0), len(self) - 1)
+
+    def keyframe_before(self, frame: int) -> int:
+        return int(self.keyframe_for[self.clip(frame)])
+
+    def time_to_frame(self, seconds: float) -> int:
+        if len(self) > 1 and (
+            seconds * 1000 >= 2 * self.pts_msec[-1] - self.pts_msec[-2]
+        ):
+            return len(self)
+        frame = np.searchsorted(
+            self.pts_msec, seconds * 1000 + PTS_TOLERANCE_MSEC, side="right"
+        )
+        return max(int(frame) - 1, 0)
@@ -0,0 +1,194 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import ENCODER_THREADS
+from npz_cache import atomic_savez
+
+SCORE_HEIGHT = 240
+FEATURE_SIZE = (16, 16)
+DIVERSITY_WEIGHT = 1.0
+CANDIDATE_FACTOR = 3
+SCORE_CACHE_NAME = ".scores.npz"
+SCORE_VERSION = 1
+
+
+def score_gray(gray):
+    if gray.shape[0] > SCORE_HEIGHT:
+        width = round(gray.shape[1] * SCORE_HEIGHT / gray.shape[0])
+        gray = cv2.resize(
+            gray, (width, SCORE_HEIGHT), interpolation=cv2.INTER_AREA
+        )
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+
+    feature = cv2.resize(gray, FEATURE_SIZE, interpolation=cv2.INTER_AREA)
+    feature = feature.astype(np.float32).ravel()
+    feature -= feature.mean()
+    norm = np.linalg.norm(feature)
+    if norm > 0:
+        feature /= norm
+    return sharpness, feature
+
+
+def score_frame(frame):
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return score_gray(frame)
+
+
+def score_file(path):
+    # Half-scale JPEG decoding is enough for the downscaled scoring pass.
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if gray is None:
+        raise ValueError(f"Cannot read image: {path}")
+    return score_gray(gray)
+
+
+def load_scores(cache_path, source_stat=None) -> dict:
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with np.load(cache_path) as data:
+            if int(data["version"]) != SCORE_VERSION:
+                return {}
+            if source_stat is not None and (
+                int(data["size"]) != source_stat.st_size
+                or float(data["mtime"]) != source_stat.st_mtime
+            ):
+                return {}
+            return {
+                key: (sharpness, feature, stat)
+                for key, sharpness, feature, stat in zip(
+                    data["keys"].tolist(),
+                    data["sharpness"],
+                    data["features"],
+                    data["stats"].tolist(),
+                )
+            }
+    except Exception:
+        return {}
+
+
+def save_scores(cache_path, scores, source_stat=None) -> None:
+    if not scores:
+        return
+    keys = list(scores)
+    try:
+        atomic_savez(
+            cache_path,
+            version=SCORE_VERSION,
+            size=source_stat.st_size if source_stat else 0,
+            mtime=source_stat.st_mtime if source_stat else 0.0,
+            keys=np.array(keys),
+            sharpness=np.array([scores[key][0] for key in keys]),
+            features=np.array(
+                [scores[key][1] for key in keys], dtype=np.float32
+            ).reshape(len(keys), np.prod(FEATURE_SIZE)),
+            stats=np.array(
+                [scores[key][2] for key in keys], dtype=np.float64
+            ).reshape(len(keys), 2),
+        )
+    except OSError:
+        pass
+
+
+def score_files(paths, num_workers: int = ENCODER_THREADS):
+    sharpness = np.zeros(len(paths))
+    features = np.zeros((len(paths), np.prod(FEATURE_SIZE)), np.float32)
+
+    by_dir = {}
+    for i, path in enumerate(paths):
+        by_dir.setdefault(os.path.dirname(path), []).append(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        for directory, indices in by_dir.items():
+            cache_path = os.path.join(directory, SCORE_CACHE_NAME)
+            scores = load_scores(cache_path)
+            missing = []
+            for i in indices:
+                stat = os.stat(paths[i])
+                name = os.path.basename(paths[i])
+                cached = scores.get(name)
+                file_stat = [stat.st_size, stat.st_mtime]
+                if cached is not None and cached[2] == file_stat:
+                    sharpness[i], features[i] = cached[0], cached[1]
+                else:
+                    missing.append((i, name, file_stat))
+
+            results = executor.map(
+                score_file, [paths[i] for i, _, _ in missing]
+            )
+            for (i, name, file_stat), (value, feature) in zip(
+                missing, results
+            ):
+                sharpness[i], features[i] = value, feature
+                scores[name] = (value, feature, file_stat)
+
+            if missing:
+                save_scores(cache_path, scores)
+    return sharpness, features
+
+
+def score_video_frames(
+    video_reader, frame_indices, num_workers: int = ENCODER_THREADS
+):
+    cache_path = video_reader.path + SCORE_CACHE_NAME
+    video_stat = os.stat(video_reader.path)
+    scores = load_scores(cache_path, video_stat)
+
+    frame_indices = [int(i) for i in frame_indices]
+    missing = [i for i in frame_indices if i not in scores]
+    num_workers = max(1, num_workers)
+
+    def collect(frame_index, future):
+        value, feature = future.result()
+        # Frames are validated by the video's own size and mtime.
+        scores[frame_index] = (value, feature, [0, 0])
+
+    # Only a few full-resolution frames are in flight at a time.
+    pending = []
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for frame_index, frame in video_reader.get_frames(missing):
+            pending.append((frame_index, executor.submit(score_frame, frame)))
+            if len(pending) >= 2 * num_workers:
+                collect(*pending.pop(0))
+        for frame_index, future in pending:
+            collect(frame_index, future)
+
+    if missing:
+        save_scores(cache_path, scores, video_stat)
+
+    scored = [i for i in frame_indices if i in scores]
+    sharpness = np.array([scores[i][0] for i in scored])
+    features = np.array(
+        [scores[i][1] for i in scored], dtype=np.float32
+    ).reshape(len(scored), np.prod(FEATURE_SIZE))
+    return np.array(scored, dtype=int), sharpness, features
+
+
+def select_diverse(
+    sharpness,
+    features,
+    num_frames: int,
+    diversity_weight: float = DIVERSITY_WEIGHT,
+):
+    num_items = len(sharpness)
+    if num_items <= num_frames:
+        return np.arange(num_items)
+
+    # Sharpness ranks are comparable across videos with different content;
+    # the raw Laplacian variance is not.
+    sharpness_rank = np.argsort(np.argsort(sharpness)) / (num_items - 1)
+    min_distance = np.full(num_items, np.inf)
+    selected = []
+    gain = sharpness_rank.copy()
+    for _ in range(num_frames):
+        best = int(np.argmax(gain))
+        selected.append(best)
+        distance = (1 - features @ features[best]) / 2
+        min_distance = np.minimum(min_distance, distance)
+        gain = sharpness_rank + diversity_weight * min_distance
+        gain[selected] = -np.inf
+    return np.sort(np.array(selected))
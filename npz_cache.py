@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+def atomic_savez(path, **arrays) -> None:
+    # Each writer gets its own temporary file, so concurrent writers and
+    # interrupted writes never leave a partial file at path.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,382 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from config import FRAME_QUEUE_SIZE, PROGRESS_INTERVAL, SAVE_IMG_EXTENSION
+
+ROTATE_CODES = {
+    "right": cv2.ROTATE_90_COUNTERCLOCKWISE,
+    "left": cv2.ROTATE_90_CLOCKWISE,
+}
+
+IMAGE_CODECS = {"jpg": ".jpg", "webp": ".webp", "png": ".png"}
+INTERPOLATIONS = {
+    "area": cv2.INTER_AREA,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "lanczos": cv2.INTER_LANCZOS4,
+    "nearest": cv2.INTER_NEAREST,
+}
+JPEG_SUBSAMPLINGS = ["444", "422", "420"]
+
+
+def draw_frame_number(frame, number: int):
+    if not frame.flags.writeable:
+        frame = frame.copy()
+    return cv2.putText(
+        frame,
+        str(number),
+        (20, 40),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1.0,
+        (0, 0, 255),
+        thickness=2,
+    )
+
+
+class ImageFormat:
+    def __init__(
+        self,
+        codec: str = SAVE_IMG_EXTENSION.lstrip("."),
+        quality: int = None,
+        subsampling: str = None,
+        long_side: int = None,
+        interpolation: str = "area",
+    ):
+        if codec not in IMAGE_CODECS:
+            raise ValueError(f"Unknown image codec: {codec}")
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation: {interpolation}")
+        if subsampling is not None and codec != "jpg":
+            raise ValueError("Chroma subsampling only applies to JPEG")
+        if long_side is not None and long_side <= 0:
+            raise ValueError("long_side must be positive")
+
+        self.codec = codec
+        self.extension = IMAGE_CODECS[codec]
+        self.long_side = long_side
+        self.interpolation = INTERPOLATIONS[interpolation]
+        # An empty parameter list keeps OpenCV's defaults, so the default
+        # format writes the same bytes as before.
+        self.params = []
+        if quality is not None:
+            flag = {
+                "jpg": cv2.IMWRITE_JPEG_QUALITY,
+                "webp": cv2.IMWRITE_WEBP_QUALITY,
+                "png": cv2.IMWRITE_PNG_COMPRESSION,
+            }[codec]
+            self.params += [flag, quality]
+        if subsampling is not None:
+            if subsampling not in JPEG_SUBSAMPLINGS:
+                raise ValueError(f"Unknown chroma subsampling: {subsampling}")
+            if not hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+                raise ValueError(
+                    "Chroma subsampling needs OpenCV 4.7 or newer"
+                )
+            self.params += [
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                getattr(cv2, f"IMWRITE_JPEG_SAMPLING_FACTOR_{subsampling}"),
+            ]
+
+    def resize(self, frame):
+        if self.long_side is None:
+            return frame
+        height, width = frame.shape[:2]
+        scale = self.long_side / max(height, width)
+        # Frames are only ever shrunk; upscaling would only add bytes.
+        if scale >= 1:
+            return frame
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(frame, size, interpolation=self.interpolation)
+
+    def encode(self, frame):
+        ret, buf = cv2.imencode(
+            self.extension, self.resize(frame), self.params
+        )
+        if not ret:
+            raise ValueError(f"Failed to encode {self.extension} image")
+        return buf
+
+
+def add_image_format_arguments(parser) -> None:
+    parser.add_argument(
+        "--codec",
+        type=str,
+        choices=list(IMAGE_CODECS),
+        default=SAVE_IMG_EXTENSION.lstrip("."),
+        help="Image codec of the saved frames",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=None,
+        help="JPEG or WebP quality (0-100, WebP above 100 is lossless), or "
+        + "PNG compression level (0-9); OpenCV's default when omitted",
+    )
+    parser.add_argument(
+        "--subsampling",
+        type=str,
+        choices=JPEG_SUBSAMPLINGS,
+        default=None,
+        help="JPEG chroma subsampling",
+    )
+    parser.add_argument(
+        "--long_side",
+        type=int,
+        default=None,
+        help="Shrink saved frames so their longer side is at most this many "
+        + "pixels",
+    )
+    parser.add_argument(
+        "--interpolation",
+        type=str,
+        choices=list(INTERPOLATIONS),
+        default="area",
+        help="Interpolation used by --long_side",
+    )
+
+
+def image_format_from_args(args) -> ImageFormat:
+    return ImageFormat(
+        args.codec,
+        args.quality,
+        args.subsampling,
+        args.long_side,
+        args.interpolation,
+    )
+
+
+class Sink:
+    def __init__(
+        self, name: str, queue_size: int = FRAME_QUEUE_SIZE, transform=None
+    ):
+        self.name = name
+        self.transform = transform
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.error = None
+        self.frames = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+
+    def open(self) -> None:
+        pass
+
+    def write(self, frame_index: int, frame) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def put(self, frame_index: int, frame) -> None:
+        if self.error is not None:
+            raise self.error
+        start = time.perf_counter()
+        self.queue.put((frame_index, frame))
+        self.blocked_time += time.perf_counter() - start
+
+    def finish(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        try:
+            self.open()
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                if self.error is not None:
+                    continue
+                start = time.perf_counter()
+                frame_index, frame = item
+                if self.transform is not None:
+                    frame = self.transform(frame_index, frame)
+                self.write(frame_index, frame)
+                self.busy_time += time.perf_counter() - start
+                self.frames += 1
+        except Exception as e:
+            self.error = e
+            while self.queue.get() is not None:
+                pass
+        finally:
+            try:
+                self.close()
+            except Exception as e:
+                self.error = self.error or e
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "frames": self.frames,
+            "busy_time": self.busy_time,
+            "blocked_time": self.blocked_time,
+            "fps": self.frames / self.busy_time if self.busy_time else 0.0,
+        }
+
+
+class VideoSink(Sink):
+    def __init__(
+        self,
+        output_path: str,
+        fps: float,
+        fourcc: str = "mp4v",
+        queue_size: int = FRAME_QUEUE_SIZE,
+        transform=None,
+    ):
+        super().__init__("video", queue_size, transform)
+        self.output_path = output_path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.out = None
+
+    def write(self, frame_index: int, frame) -> None:
+        if self.out is None:
+            height, width = frame.shape[:2]
+            self.out = cv2.VideoWriter(
+                self.output_path, self.fourcc, self.fps, (width, height)
+            )
+            if not self.out.isOpened():
+                raise ValueError(f"Cannot open {self.output_path}")
+        self.out.write(frame)
+
+    def close(self) -> None:
+        if self.out is not None:
+            self.out.release()
+
+
+class ImageSink(Sink):
+    def __init__(
+        self,
+        output_dir: str,
+        name_format,
+        height: int = None,
+        image_format: ImageFormat = None,
+        name: str = "images",
+        queue_size: int = FRAME_QUEUE_SIZE,
+        transform=None,
+    ):
+        super().__init__(name, queue_size, transform)
+        self.output_dir = output_dir
+        self.name_format = name_format
+        self.height = height
+        self.image_format = image_format or ImageFormat()
+
+    def open(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def write(self, frame_index: int, frame) -> None:
+        if self.height is not None:
+            frame = resize_frame(frame, self.height)
+        output_path = os.path.join(
+            self.output_dir, self.name_format(frame_index)
+        )
+        self.image_format.encode(frame).tofile(output_path)
+
+
+class Tee:
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.start_time = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        for sink in self.sinks:
+            sink.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, frame_index: int, frame) -> None:
+        for sink in self.sinks:
+            sink.put(frame_index, frame)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.finish()
+        self.elapsed = time.perf_counter() - self.start_time
+        for sink in self.sinks:
+            if sink.error is not None:
+                raise sink.error
+
+    def stats(self):
+        return [sink.stats() for sink in self.sinks]
+
+    def print_stats(self) -> None:
+        for stats in self.stats():
+            print(
+                f"{stats['name']}: {stats['frames']} frames, "
+                f"busy {stats['busy_time']:.2f} s "
+                f"({stats['fps']:.1f} frames/s), "
+                f"decoder blocked {stats['blocked_time']:.2f} s"
+            )
+        print(f"total: {self.elapsed:.2f} s")
+
+
+def read_frames(cap, start_frame: int = 0, end_frame: int = None):
+    start_frame = max(start_frame, 0)
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    frame_index = start_frame
+    while end_frame is None or frame_index < end_frame:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_index, frame
+        frame_index += 1
+
+
+def rotate_frames(frames, rotate_code=None):
+    if rotate_code is None:
+        yield from frames
+        return
+    for frame_index, frame in frames:
+        yield frame_index, cv2.rotate(frame, rotate_code)
+
+
+def resize_frame(frame, height: int):
+    if frame.shape[0] == height:
+        return frame
+    width = round(frame.shape[1] * height / frame.shape[0])
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def run(
+    frames, sinks, progress=None, cancel_event=None, verbose: bool = False
+) -> bool:
+    completed = True
+    count = 0
+    with Tee(sinks) as tee:
+        for frame_index, frame in frames:
+            if cancel_event is not None and cancel_event.is_set():
+                completed = False
+                break
+            tee.put(frame_index, frame)
+            count += 1
+            if progress is not None:
+                progress(count)
+
+    if verbose:
+        tee.print_stats()
+    return completed
+
+
+def print_progress(total: int, interval: float = PROGRESS_INTERVAL):
+    last = 0.0
+
+    def progress(count: int) -> None:
+        nonlocal last
+        now = time.perf_counter()
+        if count >= total or now - last >= interval:
+            last = now
+            print(f"\r[{count:6d} | {total:6d}]", end="")
+
+    return progress
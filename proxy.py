@@ -0,0 +1,151 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from config import (
+    SAVE_VIDEO_EXTENSION,
+    THUMBNAIL_COUNT,
+    THUMBNAIL_HEIGHT,
+    TMP_DIR,
+    VIEWER_HEIGHT,
+)
+from utils import VideoReader
+
+
+def get_proxy_paths(video_path, height):
+    cache_dir = os.path.join(os.path.dirname(video_path), TMP_DIR)
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    base_path = os.path.join(cache_dir, f"{name}_proxy_{height}")
+    return (
+        base_path + SAVE_VIDEO_EXTENSION,
+        base_path + "_thumbnails.npz",
+        base_path + ".json",
+    )
+
+
+def get_source_info(video_path) -> dict:
+    stat = os.stat(video_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_proxy(video_path, height: int = VIEWER_HEIGHT):
+    proxy_path, thumbnails_path, meta_path = get_proxy_paths(
+        video_path, height
+    )
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["source"] != get_source_info(video_path):
+        return None
+    if not os.path.exists(thumbnails_path):
+        return None
+    if meta["proxy"] and not os.path.exists(proxy_path):
+        return None
+
+    with np.load(thumbnails_path) as data:
+        thumbnail_frames = data["frames"]
+        thumbnails = list(data["thumbnails"])
+    return (
+        proxy_path if meta["proxy"] else video_path,
+        thumbnail_frames,
+        thumbnails,
+    )
+
+
+def build_proxy(
+    video_path,
+    height: int = VIEWER_HEIGHT,
+    num_thumbnails: int = THUMBNAIL_COUNT,
+    thumbnail_height: int = THUMBNAIL_HEIGHT,
+    progress=None,
+    stop_signal=None,
+):
+    cached = load_proxy(video_path, height)
+    if cached is not None:
+        return cached
+
+    proxy_path, thumbnails_path, meta_path = get_proxy_paths(
+        video_path, height
+    )
+    os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+
+    video_reader = VideoReader(video_path)
+    fps = video_reader.get_fps()
+    width, original_height = video_reader.get_size()
+    total_frames = video_reader.get_frame_count()
+    if not original_height:
+        raise ValueError(f"Cannot read video: {video_path}")
+
+    use_proxy = original_height > height
+    proxy_size = (int(height * width / original_height) // 2 * 2, height)
+    thumbnail_size = (
+        max(1, int(thumbnail_height * width / original_height)),
+        thumbnail_height,
+    )
+    thumbnail_frames = np.unique(
+        np.linspace(0, max(total_frames - 1, 0), num_thumbnails).astype(int)
+    )
+
+    thumbnails = []
+    tmp_path = proxy_path + ".tmp" + SAVE_VIDEO_EXTENSION
+    if use_proxy:
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        out = cv2.VideoWriter(tmp_path, fourcc, fps, proxy_size)
+        thumbnail_set = set(thumbnail_frames.tolist())
+        cap = video_reader.cap
+        frame_index = 0
+        while stop_signal is None or not stop_signal.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame = cv2.resize(frame, proxy_size, interpolation=cv2.INTER_AREA)
+            out.write(frame)
+            if frame_index in thumbnail_set:
+                thumbnails.append(
+                    cv2.resize(
+                        frame, thumbnail_size, interpolation=cv2.INTER_AREA
+                    )
+                )
+            frame_index += 1
+            if progress is not None and total_frames:
+                progress(frame_index / total_frames)
+        out.release()
+    else:
+        for i, (_, frame) in enumerate(
+            video_reader.get_frames(thumbnail_frames.tolist())
+        ):
+            if stop_signal is not None and stop_signal.is_set():
+                break
+            thumbnails.append(
+                cv2.resize(frame, thumbnail_size, interpolation=cv2.INTER_AREA)
+            )
+            if progress is not None:
+                progress((i + 1) / len(thumbnail_frames))
+    video_reader.release()
+
+    if stop_signal is not None and stop_signal.is_set():
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    thumbnail_frames = thumbnail_frames[: len(thumbnails)]
+    if use_proxy:
+        os.replace(tmp_path, proxy_path)
+    np.savez(
+        thumbnails_path,
+        frames=thumbnail_frames,
+        thumbnails=np.array(thumbnails),
+    )
+    with open(meta_path, "w") as f:
+        json.dump(
+            {"source": get_source_info(video_path), "proxy": use_proxy}, f
+        )
+
+    return (
+        proxy_path if use_proxy else video_path,
+        thumbnail_frames,
+        thumbnails,
+    )
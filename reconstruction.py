@@ -1,9 +1,14 @@
 import argparse
 import os
 
-import cv2
-
 from config import SAVE_VIDEO_EXTENSION
+from pipeline import (
+    VideoSink,
+    draw_frame_number,
+    print_progress,
+    read_frames,
+    run,
+)
 from utils import VideoReader
 
 
@@ -11,37 +16,24 @@ def reconstruct_video_with_frame_number(
     video_reader: VideoReader,
     output_dir: str,
 ):
-    cap = video_reader.cap
-    fps = video_reader.get_fps()
-    width, height = video_reader.get_size()
     total_frames = video_reader.get_frame_count()
-
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     output_path = os.path.join(
         output_dir, video_reader.get_name() + SAVE_VIDEO_EXTENSION
     )
-    out = cv2.VideoWriter(output_path, fourcc, fps, (int(width), int(height)))
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            print(f"\r[{frame_index:6d} | {total_frames:6d}]", end="")
-            frame = cv2.putText(
-                frame,
-                str(frame_index),
-                (20, 40),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                1.0,
-                (0, 0, 255),
-                thickness=2,
-            )
-            out.write(frame)
-        else:
-            break
-
-    cap.release()
-    out.release()
+
+    sink = VideoSink(
+        output_path,
+        video_reader.get_fps(),
+        transform=lambda i, frame: draw_frame_number(frame, i + 1),
+    )
+    run(
+        read_frames(video_reader.cap),
+        [sink],
+        progress=print_progress(total_frames),
+    )
+    print()
+
+    video_reader.cap.release()
     return None
 
 
@@ -1,53 +1,106 @@
 import argparse
 import os
+import shutil
+import subprocess
 
 import cv2
 
+from config import IMG_DIR
+from pipeline import (
+    ROTATE_CODES,
+    ImageFormat,
+    ImageSink,
+    VideoSink,
+    add_image_format_arguments,
+    image_format_from_args,
+    read_frames,
+    rotate_frames,
+    run,
+)
+
+# Display matrix angles are counterclockwise, the legacy rotate tag is
+# clockwise.
+DISPLAY_ROTATIONS = {"right": 90, "left": -90, "none": 0}
+ROTATE_TAGS = {"right": 270, "left": 90, "none": 0}
+
 
 def get_basename(file_path):
     return os.path.splitext(os.path.basename(file_path))[0]
 
 
+def write_rotation_metadata(input_path, output_path, rotate_direction):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is required for metadata-only rotation")
+
+    command = [ffmpeg, "-y", "-loglevel", "error"]
+    display_rotation = [
+        "-display_rotation:v:0",
+        str(DISPLAY_ROTATIONS[rotate_direction]),
+    ]
+    copy = ["-map", "0", "-c", "copy"]
+    result = subprocess.run(
+        command + display_rotation + ["-i", input_path] + copy + [output_path],
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        # ffmpeg before 6.0 has no -display_rotation.
+        subprocess.run(
+            command
+            + ["-i", input_path]
+            + copy
+            + [
+                "-metadata:s:v:0",
+                f"rotate={ROTATE_TAGS[rotate_direction]}",
+                output_path,
+            ],
+            check=True,
+        )
+
+
 def process_video(
     input_path,
     output_dir,
     rotate_direction,
+    start_frame: int = 0,
+    end_frame: int = None,
+    save_images: bool = False,
+    metadata_only: bool = False,
+    image_format: ImageFormat = None,
 ):
     print(f"Rotate direction: {rotate_direction}")
     video_name = get_basename(input_path)
 
-    cap = cv2.VideoCapture(input_path)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, f"{video_name}.mp4")
 
-    fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-    if rotate_direction == "right":
-        video = cv2.VideoWriter(output_path, fourcc, fps, (height, width))
-    elif rotate_direction == "left":
-        video = cv2.VideoWriter(output_path, fourcc, fps, (height, width))
-    else:
-        video = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    if metadata_only:
+        if start_frame or end_frame is not None or save_images:
+            raise ValueError(
+                "Metadata-only rotation cannot cut or save images"
+            )
+        write_rotation_metadata(input_path, output_path, rotate_direction)
+        return
 
-    if not video.isOpened():
-        print("Cannot be opened")
+    cap = cv2.VideoCapture(input_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
 
-    while True:
-        ret, frame = cap.read()
-        if ret:
-            if rotate_direction == "right":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif rotate_direction == "left":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+    sinks = [VideoSink(output_path, fps)]
+    if save_images:
+        image_format = image_format or ImageFormat()
+        sinks.append(
+            ImageSink(
+                os.path.join(output_dir, IMG_DIR),
+                lambda i: f"{video_name}_{i + 1}{image_format.extension}",
+                image_format=image_format,
+            )
+        )
 
-            video.write(frame)
-        else:
-            break
+    frames = read_frames(cap, start_frame, end_frame)
+    frames = rotate_frames(frames, ROTATE_CODES.get(rotate_direction))
+    run(frames, sinks)
 
-    video.release()
+    cap.release()
 
 
 if __name__ == "__main__":
@@ -67,6 +120,26 @@ if __name__ == "__main__":
         help="Rotation direction: 'right' for clockwise, 'left' for "
         + "counterclockwise, 'none' for no rotation (default)",
     )
+    parser.add_argument(
+        "-s", "--start", type=int, default=0, help="Start frame"
+    )
+    parser.add_argument(
+        "-e", "--end", type=int, default=None, help="End frame (exclusive)"
+    )
+    parser.add_argument(
+        "--save_images",
+        action="store_true",
+        help="Also save the rotated frames as images in the same pass",
+    )
+    parser.add_argument(
+        "-m",
+        "--metadata",
+        action="store_true",
+        help="Only set the rotation flag in the container without "
+        + "re-encoding; players and decoders that honour it show the "
+        + "rotated video",
+    )
+    add_image_format_arguments(parser)
 
     args = parser.parse_args()
 
@@ -74,4 +147,13 @@ if __name__ == "__main__":
     output_dir = args.output
     rotate_direction = args.rotate
 
-    process_video(input_path, output_dir, rotate_direction)
+    process_video(
+        input_path,
+        output_dir,
+        rotate_direction,
+        args.start,
+        args.end,
+        args.save_images,
+        args.metadata,
+        image_format_from_args(args),
+    )
@@ -1,58 +1,284 @@
+import argparse
+import math
+import multiprocessing
 import os
 import re
 import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
-np.random.seed(0)
+from config import ENCODER_THREADS, FRAME_CACHE_BYTES
+from dedup import IMAGE_EXTENSIONS, HashIndex, dedup_paths, hash_frames
+from frame_score import (
+    CANDIDATE_FACTOR,
+    score_files,
+    score_video_frames,
+    select_diverse,
+)
+from pipeline import (
+    ImageFormat,
+    add_image_format_arguments,
+    image_format_from_args,
+)
+from split_frame import find_videos, get_dir_name, get_video_name, is_video
+from utils import ImageWriterPool, VideoReader
+
+SEED = 0
 
 
 def extract_number(filename):
-    match = re.search(r"_(\d+)\.jpg$", filename)
+    match = re.search(r"_(\d+)\.\w+$", filename)
     return int(match.group(1)) if match else 0
 
 
+def sample_indices(num_items: int, num_frames: int, std_dev: float, rng):
+    if num_items == 0:
+        return np.array([], dtype=int)
+    center = num_items // 2
+
+    # Mass of N(center, std_dev) falling on [i, i + 1), which is where the
+    # truncated draws of the old rejection loop landed.
+    erf = np.vectorize(math.erf)
+    edges = (np.arange(num_items + 1) - center) / (std_dev * math.sqrt(2))
+    weights = np.diff(erf(edges))
+    weights = np.maximum(weights, np.finfo(np.float64).tiny)
+
+    indices = rng.choice(
+        num_items,
+        size=min(num_frames, num_items),
+        replace=False,
+        p=weights / weights.sum(),
+    )
+    return np.sort(indices)
+
+
+def get_rng(name: str):
+    return np.random.default_rng([SEED, zlib.crc32(name.encode())])
+
+
+def select_video_frames(
+    video_path: str,
+    save_dir: str,
+    num_frames: int,
+    std_dev: int,
+    num_encoders: int = ENCODER_THREADS,
+    dedup_distance: int = None,
+    score: bool = False,
+    image_format: ImageFormat = None,
+) -> int:
+    image_format = image_format or ImageFormat()
+    video_name = get_video_name(video_path)
+    dir_name = get_dir_name(video_path)
+    name = f"{dir_name}_{video_name}"
+
+    video_reader = VideoReader(video_path, cache_bytes=0, readahead=0)
+    num_candidates = num_frames * CANDIDATE_FACTOR if score else num_frames
+    if score:
+        # Frames decoded for scoring stay cached for the write pass below
+        # instead of being seeked and decoded a second time.
+        width, height = video_reader.get_size()
+        video_reader.cache.max_bytes = min(
+            int(num_candidates * width * height * 3), FRAME_CACHE_BYTES
+        )
+    total_frames = len(video_reader.get_index())
+    selected_indices = sample_indices(
+        total_frames, num_candidates, std_dev, get_rng(name)
+    )
+    if score:
+        candidates, sharpness, features = score_video_frames(
+            video_reader, selected_indices, num_encoders
+        )
+        selected_indices = candidates[
+            select_diverse(sharpness, features, num_frames)
+        ]
+    print(f"{name}: selected {len(selected_indices)}/{total_frames} frames")
+
+    os.makedirs(save_dir, exist_ok=True)
+    count = 0
+    if dedup_distance is not None:
+        hashes = HashIndex(dedup_distance)
+    with ImageWriterPool(num_encoders, image_format=image_format) as writer:
+        for frame_index, frame in video_reader.get_frames(
+            selected_indices.tolist()
+        ):
+            if dedup_distance is not None:
+                (value,) = hash_frames([frame])
+                if hashes.query(value):
+                    continue
+                hashes.add(value, frame_index)
+            output_path = os.path.join(
+                save_dir, f"{name}_{frame_index}{image_format.extension}"
+            )
+            writer.put(output_path, frame)
+            count += 1
+
+    video_reader.release()
+    if count < len(selected_indices):
+        print(f"{name}: skipped {len(selected_indices) - count} duplicates")
+    return count
+
+
 def select_frame(
     source_dir: str,
     save_dir: str,
     num_frames: int,
     std_dev: int,
+    dedup_distance: int = None,
+    score: bool = False,
+    image_format: ImageFormat = None,
 ):
-    files = os.listdir(source_dir)
+    if os.path.isfile(source_dir):
+        return select_video_frames(
+            source_dir,
+            save_dir,
+            num_frames,
+            std_dev,
+            dedup_distance=dedup_distance,
+            score=score,
+            image_format=image_format,
+        )
+
+    files = [
+        file
+        for file in os.listdir(source_dir)
+        if file.lower().endswith(IMAGE_EXTENSIONS)
+    ]
     sorted_files = sorted(files, key=extract_number)
-    center_frame = len(sorted_files) // 2
 
-    selected_indices = set()
-    while len(selected_indices) < num_frames:
-        indices = np.random.normal(
-            center_frame, std_dev, num_frames - len(selected_indices)
-        ).astype(int)
+    selected_indices = sample_indices(
+        len(sorted_files),
+        num_frames * CANDIDATE_FACTOR if score else num_frames,
+        std_dev,
+        get_rng(os.path.basename(os.path.normpath(source_dir))),
+    )
+    src_paths = [
+        os.path.join(source_dir, sorted_files[index])
+        for index in selected_indices
+    ]
+    if score:
+        sharpness, features = score_files(src_paths)
+        src_paths = [
+            src_paths[i]
+            for i in select_diverse(sharpness, features, num_frames)
+        ]
+    print(f"selected_indices: {len(src_paths)}")
 
-        valid_indices = {i for i in indices if 0 <= i < len(files)}
-        selected_indices.update(valid_indices)
-    print(f"selected_indices: {len(selected_indices)}")
+    if dedup_distance is not None:
+        src_paths, duplicates = dedup_paths(src_paths, dedup_distance)
+        print(f"skipped {len(duplicates)} duplicates")
 
-    for index in selected_indices:
-        src_path = os.path.join(source_dir, sorted_files[index])
+    for src_path in src_paths:
         shutil.copy(src_path, save_dir)
+    return len(src_paths)
 
 
 def process_directory(
-    base_dir: str, save_dir: str, num_frames: int, std_dev: int
+    base_dir: str,
+    save_dir: str,
+    num_frames: int,
+    std_dev: int,
+    num_workers: int = 1,
+    dedup_distance: int = None,
+    score: bool = False,
+    image_format: ImageFormat = None,
 ):
     if os.path.isfile(base_dir):
-        select_frame(os.path.dirname(base_dir), save_dir, num_frames, std_dev)
+        if is_video(base_dir):
+            sources = [base_dir]
+        else:
+            sources = [os.path.dirname(base_dir)]
     elif os.path.isdir(base_dir):
+        sources = find_videos(base_dir)
         for item in os.listdir(base_dir):
             item_path = os.path.join(base_dir, item)
             if os.path.isdir(item_path):
-                select_frame(item_path, save_dir, num_frames, std_dev)
+                sources.append(item_path)
+    else:
+        raise ValueError(f"{base_dir} does not exist")
+
+    os.makedirs(save_dir, exist_ok=True)
+    if num_workers > 1 and len(sources) > 1:
+        # ImageWriterPool and OpenCV threads make forking unsafe.
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    select_frame,
+                    source,
+                    save_dir,
+                    num_frames,
+                    std_dev,
+                    dedup_distance,
+                    score,
+                    image_format,
+                )
+                for source in sources
+            ]
+            for future in futures:
+                future.result()
+        return
+
+    for source in sources:
+        select_frame(
+            source,
+            save_dir,
+            num_frames,
+            std_dev,
+            dedup_distance,
+            score,
+            image_format,
+        )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        default="/home/ohwada/imgs",
+        help="Video, directory of videos, or directory of frame directories",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default="/home/ohwada/train_imgs"
+    )
+    parser.add_argument("-n", "--num_frames", type=int, default=40)
+    parser.add_argument("-s", "--std_dev", type=int, default=30)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of videos or directories processed in parallel",
+    )
+    parser.add_argument(
+        "-d",
+        "--dedup",
+        type=int,
+        default=None,
+        help="Skip frames whose perceptual hash is within this Hamming "
+        + "distance of an already selected frame of the same video",
+    )
+    parser.add_argument(
+        "--score",
+        action="store_true",
+        help="Draw more Gaussian candidates and keep the sharpest, most "
+        + "mutually different ones within the same frame budget",
+    )
+    add_image_format_arguments(parser)
+    args = parser.parse_args()
+
     process_directory(
-        base_dir="/home/ohwada/imgs",
-        save_dir="/home/ohwada/train_imgs",
-        num_frames=40,
-        std_dev=30,
+        base_dir=args.input,
+        save_dir=args.output,
+        num_frames=args.num_frames,
+        std_dev=args.std_dev,
+        num_workers=args.workers,
+        dedup_distance=args.dedup,
+        score=args.score,
+        image_format=image_format_from_args(args),
     )
@@ -0,0 +1,140 @@
+import bisect
+import glob
+import io
+import json
+import mmap
+import os
+import tarfile
+
+SHARD_SIZE = 1 << 30
+SHARD_EXTENSION = ".tar"
+INDEX_EXTENSION = ".idx"
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def shard_name(prefix: str, shard_index: int) -> str:
+    return f"{prefix}-{shard_index:06d}{SHARD_EXTENSION}"
+
+
+class ShardWriter:
+    def __init__(self, output_dir, prefix, shard_size: int = SHARD_SIZE):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard_index = -1
+        self.tar = None
+        self.samples = []
+        self.shard_paths = []
+        os.makedirs(output_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open_shard(self) -> None:
+        self.close_shard()
+        self.shard_index += 1
+        shard_path = os.path.join(
+            self.output_dir, shard_name(self.prefix, self.shard_index)
+        )
+        self.tar = tarfile.open(shard_path, "w", format=tarfile.GNU_FORMAT)
+        self.samples = []
+        self.shard_paths.append(shard_path)
+
+    def close_shard(self) -> None:
+        if self.tar is None:
+            return
+        self.tar.close()
+        index_path = (
+            os.path.splitext(self.shard_paths[-1])[0] + INDEX_EXTENSION
+        )
+        with open(index_path, "w") as f:
+            json.dump({"samples": self.samples}, f)
+        self.tar = None
+
+    def write(self, key: str, files: dict) -> None:
+        payloads = {}
+        for ext, path in files.items():
+            with open(path, "rb") as f:
+                payloads[ext] = f.read()
+
+        sample_size = sum(len(data) for data in payloads.values())
+        if self.tar is None or (
+            self.samples and self.tar.offset + sample_size > self.shard_size
+        ):
+            self.open_shard()
+
+        members = {}
+        for ext, data in payloads.items():
+            tarinfo = tarfile.TarInfo(name=key + ext)
+            tarinfo.size = len(data)
+            self.tar.addfile(tarinfo, io.BytesIO(data))
+            padded_size = -(-len(data) // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+            members[ext] = [self.tar.offset - padded_size, len(data)]
+        self.samples.append({"key": key, "files": members})
+
+    def close(self) -> None:
+        self.close_shard()
+
+
+class ShardReader:
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, "*" + SHARD_EXTENSION)
+        self.shard_paths = sorted(glob.glob(path))
+        self.samples = []
+        self.starts = []
+        for shard_path in self.shard_paths:
+            index_path = os.path.splitext(shard_path)[0] + INDEX_EXTENSION
+            with open(index_path) as f:
+                self.starts.append(len(self.samples))
+                self.samples += json.load(f)["samples"]
+        self.files = [None] * len(self.shard_paths)
+        self.maps = [None] * len(self.shard_paths)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.samples)
+        sample = self.samples[index]
+        shard_index = bisect.bisect_right(self.starts, index) - 1
+        shard_map = self.get_map(shard_index)
+        files = {
+            ext: shard_map[offset : offset + size]
+            for ext, (offset, size) in sample["files"].items()
+        }
+        return sample["key"], files
+
+    def __iter__(self):
+        for index in range(len(self.samples)):
+            yield self[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_map(self, shard_index):
+        if self.maps[shard_index] is None:
+            f = open(self.shard_paths[shard_index], "rb")
+            self.files[shard_index] = f
+            self.maps[shard_index] = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self.maps[shard_index]
+
+    def keys(self):
+        return [sample["key"] for sample in self.samples]
+
+    def close(self) -> None:
+        for i, shard_map in enumerate(self.maps):
+            if shard_map is not None:
+                shard_map.close()
+                self.files[i].close()
+        self.files = [None] * len(self.shard_paths)
+        self.maps = [None] * len(self.shard_paths)
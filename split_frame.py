@@ -1,10 +1,24 @@
 import argparse
+import multiprocessing
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
 
 import cv2
 
+from config import ENCODER_THREADS, FRAME_QUEUE_SIZE, PROGRESS_INTERVAL
+from pipeline import (
+    ROTATE_CODES,
+    ImageFormat,
+    add_image_format_arguments,
+    image_format_from_args,
+)
+from utils import ImageWriterPool, decode_parallel
+
 video_exts = [".mp4", ".MP4", ".avi", ".mov", ".mkv"]
 
+frame_counter = None
+
 
 def get_video_name(video_path):
     return os.path.splitext(os.path.basename(video_path))[0]
@@ -16,48 +30,234 @@ def get_dir_name(path):
     )
 
 
-def split_frame(video_path, save_path):
-    if os.path.isdir(video_path):
-        video_paths = []
-        for ext in video_exts:
-            video_paths += [
-                os.path.join(video_path, file)
-                for file in os.listdir(video_path)
-                if file.endswith(ext)
-            ]
-    else:
-        video_paths = [video_path]
+def is_video(path) -> bool:
+    exts = {ext.lower() for ext in video_exts}
+    return os.path.splitext(path)[1].lower() in exts
 
-    for video_path in video_paths:
-        video_name = get_video_name(video_path)
-        dir_name = get_dir_name(video_path)
+
+def find_videos(video_dir):
+    return sorted(
+        os.path.join(video_dir, file)
+        for file in os.listdir(video_dir)
+        if is_video(file)
+    )
+
+
+def init_worker(counter):
+    global frame_counter
+    frame_counter = counter
+
+
+def split_video_frames(
+    video_path,
+    save_path,
+    num_encoders: int = ENCODER_THREADS,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    verbose: bool = True,
+    rotate_direction: str = "none",
+    num_chunks: int = 1,
+    image_format: ImageFormat = None,
+) -> int:
+    image_format = image_format or ImageFormat()
+    video_name = get_video_name(video_path)
+    dir_name = get_dir_name(video_path)
+    if verbose:
         print(f"video_name: {dir_name}_{video_name}")
-        save_dir = os.path.join(save_path, f"{dir_name}_{video_name}")
-        os.makedirs(save_dir, exist_ok=True)
+    save_dir = os.path.join(save_path, f"{dir_name}_{video_name}")
+    os.makedirs(save_dir, exist_ok=True)
 
-        cap = cv2.VideoCapture(video_path)
-        frame_count = 0
+    rotate_code = ROTATE_CODES.get(rotate_direction)
+    if num_chunks > 1:
+        frame_count = decode_parallel(
+            video_path,
+            save_dir,
+            f"{dir_name}_{video_name}",
+            num_chunks,
+            rotate_code=rotate_code,
+            num_encoders=num_encoders,
+            queue_size=queue_size,
+            image_format=image_format,
+        )
+        if verbose:
+            print(f"frame_count: {frame_count}")
+        return frame_count
+
+    cap = cv2.VideoCapture(video_path)
+    frame_count = 0
+    with ImageWriterPool(
+        num_encoders, queue_size, image_format, rotate_code
+    ) as writer:
         while True:
             ret, frame = cap.read()
-            print(f"\rframe_count: {frame_count}", end="")
+            if verbose:
+                print(f"\rframe_count: {frame_count}", end="")
             if not ret:
                 break
-            cv2.imwrite(
+            writer.put(
                 os.path.join(
-                    save_dir, f"{dir_name}_{video_name}_{frame_count}.jpg"
+                    save_dir,
+                    f"{dir_name}_{video_name}_{frame_count}"
+                    + image_format.extension,
                 ),
                 frame,
             )
             frame_count += 1
+            if frame_counter is not None:
+                with frame_counter.get_lock():
+                    frame_counter.value += 1
 
+    cap.release()
+    if verbose:
+        print()
+    return frame_count
+
+
+def split_frames_parallel(
+    video_paths,
+    save_path,
+    num_workers: int,
+    num_encoders: int = ENCODER_THREADS,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    rotate_direction: str = "none",
+    image_format: ImageFormat = None,
+) -> None:
+    total_frames = 0
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        total_frames += int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         cap.release()
+
+    # The parent already runs OpenCV threads; forking could copy a held
+    # lock into a worker and hang it.
+    context = multiprocessing.get_context("spawn")
+    counter = context.Value("q", 0)
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(counter,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                split_video_frames,
+                video_path,
+                save_path,
+                num_encoders,
+                queue_size,
+                False,
+                rotate_direction,
+                image_format=image_format,
+            )
+            for video_path in video_paths
+        ]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"\rvideos: {len(futures) - len(pending)}/{len(futures)} "
+                f"frames: {counter.value}/{total_frames} "
+                f"({counter.value / max(elapsed, 1e-9):.1f} frames/s)",
+                end="",
+            )
         print()
+        for future in futures:
+            future.result()
+
+
+def split_frame(
+    video_path,
+    save_path,
+    num_encoders: int = ENCODER_THREADS,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    num_workers: int = 1,
+    rotate_direction: str = "none",
+    num_chunks: int = 1,
+    image_format: ImageFormat = None,
+):
+    if os.path.isdir(video_path):
+        video_paths = find_videos(video_path)
+    else:
+        video_paths = [video_path]
+
+    if num_workers > 1 and len(video_paths) > 1:
+        split_frames_parallel(
+            video_paths,
+            save_path,
+            num_workers,
+            num_encoders,
+            queue_size,
+            rotate_direction,
+            image_format,
+        )
+        return
+
+    for video_path in video_paths:
+        split_video_frames(
+            video_path,
+            save_path,
+            num_encoders,
+            queue_size,
+            rotate_direction=rotate_direction,
+            num_chunks=num_chunks,
+            image_format=image_format,
+        )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--video_path", type=str, required=True)
+    parser.add_argument(
+        "-e",
+        "--encoders",
+        type=int,
+        default=ENCODER_THREADS,
+        help="Number of image encoder threads",
+    )
+    parser.add_argument(
+        "-q",
+        "--queue_size",
+        type=int,
+        default=FRAME_QUEUE_SIZE,
+        help="Maximum number of decoded frames waiting to be encoded",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of videos decoded concurrently in separate processes",
+    )
+    parser.add_argument(
+        "-r",
+        "--rotate",
+        type=str,
+        choices=["right", "left", "none"],
+        default="none",
+        help="Rotate the saved frames while encoding, without a separate "
+        + "rotate_video.py pass",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunks",
+        type=int,
+        default=1,
+        help="Split each video into this many keyframe-aligned chunks "
+        + "decoded in separate processes; used when videos are not "
+        + "already spread over --workers",
+    )
+    add_image_format_arguments(parser)
     args = parser.parse_args()
     video_path = args.video_path
     save_path = "/home/ohwada/imgs"
-    split_frame(video_path, save_path)
+    split_frame(
+        video_path,
+        save_path,
+        args.encoders,
+        args.queue_size,
+        args.workers,
+        args.rotate,
+        args.chunks,
+        image_format_from_args(args),
+    )
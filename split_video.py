@@ -1,8 +1,13 @@
 import argparse
 import os
+import shutil
+import subprocess
 
 import cv2
 
+from auto_segment import detect_segments
+from pipeline import VideoSink, read_frames, run
+
 EXTRA_TIME = 1.0
 SAVE_VIDEO_EXTENSION = ".mp4"
 
@@ -13,38 +18,90 @@ def split_video(
     video_name: str,
     start_frame: int,
     end_frame: int,
+    stream_copy: bool = False,
 ):
     cap = cv2.VideoCapture(input_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
-    width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-    height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
 
-    start_frame = start_frame - int(fps * EXTRA_TIME)
+    start_frame = max(start_frame - int(fps * EXTRA_TIME), 1)
     end_frame = end_frame + int(fps * EXTRA_TIME)
 
     output_dir = os.path.join(output_dir, video_name)
     os.makedirs(output_dir, exist_ok=True)
 
     save_path = os.path.join(output_dir, video_name + SAVE_VIDEO_EXTENSION)
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(save_path, fourcc, fps, (int(width), int(height)))
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            if frame_index > end_frame:
-                break
-            if start_frame <= frame_index <= end_frame:
-                out.write(frame)
-        else:
-            break
+
+    if stream_copy:
+        cap.release()
+        copy_video_range(input_path, save_path, fps, start_frame, end_frame)
+        return None
+
+    run(
+        read_frames(cap, start_frame - 1, end_frame),
+        [VideoSink(save_path, fps)],
+    )
 
     cap.release()
-    out.release()
     return None
 
 
+def copy_video_range(
+    input_path: str,
+    output_path: str,
+    fps: float,
+    start_frame: int,
+    end_frame: int,
+) -> None:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is required for stream copy")
+
+    start_time = (start_frame - 1) / fps
+    duration = (end_frame - start_frame + 1) / fps
+    subprocess.run(
+        [
+            ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-ss",
+            f"{start_time:.6f}",
+            "-i",
+            input_path,
+            "-t",
+            f"{duration:.6f}",
+            "-map",
+            "0",
+            "-c",
+            "copy",
+            "-avoid_negative_ts",
+            "make_zero",
+            output_path,
+        ],
+        check=True,
+    )
+
+
+def split_auto_segments(
+    input_path: str,
+    output_dir: str,
+    video_name: str,
+    stream_copy: bool = False,
+) -> None:
+    segments = detect_segments(input_path)
+    print(f"Segments: {segments}")
+    for i, (start_frame, end_frame) in enumerate(segments):
+        # split_video takes 1-based inclusive frames and adds EXTRA_TIME.
+        split_video(
+            input_path,
+            output_dir,
+            f"{video_name}_{i + 1}",
+            start_frame + 1,
+            end_frame,
+            stream_copy,
+        )
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Video frame extraction script"
@@ -66,13 +123,31 @@ if __name__ == "__main__":
         "-s", "--start", type=int, default=0, help="Start frame"
     )
     parser.add_argument("-e", "--end", type=int, default=0, help="End frame")
+    parser.add_argument(
+        "-c",
+        "--copy",
+        action="store_true",
+        help="Copy compressed packets without re-encoding; the cut snaps "
+        + "to the keyframe before the start frame",
+    )
+    parser.add_argument(
+        "-a",
+        "--auto",
+        action="store_true",
+        help="Detect swing segments from motion instead of using "
+        + "--start and --end; each segment is saved as <name>_<n>",
+    )
 
     args = parser.parse_args()
 
-    split_video(
-        args.input,
-        args.output,
-        args.name,
-        args.start,
-        args.end,
-    )
+    if args.auto:
+        split_auto_segments(args.input, args.output, args.name, args.copy)
+    else:
+        split_video(
+            args.input,
+            args.output,
+            args.name,
+            args.start,
+            args.end,
+            args.copy,
+        )
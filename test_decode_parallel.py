@@ -0,0 +1,100 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_index import FrameIndex
+from split_frame import split_video_frames
+from utils import VideoReader, save_frames_as_images, split_video
+
+NUM_FRAMES = 60
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    # split_frame names frames after the directory three levels up.
+    video_dir = tmp_path_factory.mktemp("videos") / "session" / "a" / "b"
+    os.makedirs(video_dir)
+    path = str(video_dir / "clip.mp4")
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (96, 64)
+    )
+    rng = np.random.default_rng(0)
+    for i in range(NUM_FRAMES):
+        frame = cv2.GaussianBlur(
+            rng.integers(0, 256, (64, 96, 3), dtype=np.uint8), (5, 5), 0
+        )
+        cv2.putText(
+            frame, str(i), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255)
+        )
+        writer.write(frame)
+    writer.release()
+
+    keyframes = np.flatnonzero(FrameIndex.build(path).keyframes)
+    assert len(keyframes) > 2, "test video needs several GOPs"
+    return path
+
+
+def read_dir(directory) -> dict:
+    files = {}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), "rb") as f:
+            files[name] = f.read()
+    return files
+
+
+@pytest.mark.parametrize("rotate_direction", ["none", "right"])
+def test_split_video_frames_chunks_match_sequential(
+    video_path, tmp_path, rotate_direction
+):
+    sequential = split_video_frames(
+        video_path,
+        str(tmp_path / "sequential"),
+        verbose=False,
+        rotate_direction=rotate_direction,
+    )
+    parallel = split_video_frames(
+        video_path,
+        str(tmp_path / "parallel"),
+        verbose=False,
+        rotate_direction=rotate_direction,
+        num_chunks=3,
+    )
+
+    expected = read_dir(tmp_path / "sequential" / "session_clip")
+    assert sequential == parallel == NUM_FRAMES
+    assert read_dir(tmp_path / "parallel" / "session_clip") == expected
+
+
+@pytest.mark.parametrize("start_frame, end_frame", [(0, None), (17, 50)])
+def test_save_frames_as_images_chunks_match_sequential(
+    video_path, tmp_path, start_frame, end_frame
+):
+    if end_frame is None:
+        end_frame = NUM_FRAMES
+    for name, num_chunks in [("sequential", 1), ("parallel", 3)]:
+        video_reader = VideoReader(video_path)
+        save_frames_as_images(
+            video_reader,
+            str(tmp_path / name),
+            start_frame,
+            end_frame,
+            num_chunks=num_chunks,
+        )
+        video_reader.release()
+
+    expected = read_dir(tmp_path / "sequential")
+    assert sorted(expected) == sorted(
+        f"clip_{i + 1}.jpg" for i in range(start_frame, end_frame)
+    )
+    assert read_dir(tmp_path / "parallel") == expected
+
+
+def test_split_video_chunks_match_sequential(video_path, tmp_path):
+    split_video(video_path, str(tmp_path / "sequential"), "left")
+    split_video(video_path, str(tmp_path / "parallel"), "left", num_chunks=4)
+
+    expected = read_dir(tmp_path / "sequential" / "clip")
+    assert len(expected) == NUM_FRAMES
+    assert read_dir(tmp_path / "parallel" / "clip") == expected
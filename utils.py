@@ -1,20 +1,92 @@
+import multiprocessing
 import os
+import queue
 import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
 
 from config import (
+    ENCODER_THREADS,
+    FRAME_CACHE_BYTES,
+    FRAME_QUEUE_SIZE,
     IMG_DIR,
-    SAVE_IMG_EXTENSION,
+    READAHEAD_FRAMES,
+    RESIZED_IMG_DIR,
     SAVE_VIDEO_EXTENSION,
     VIDEO_DIR,
     VIDEO_EXTENTIONS,
 )
+from frame_index import PTS_TOLERANCE_MSEC, FrameIndex
+from pipeline import (
+    ROTATE_CODES,
+    ImageFormat,
+    ImageSink,
+    VideoSink,
+    read_frames,
+    rotate_frames,
+    run,
+)
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int = FRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, index):
+        return index in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get(self, index):
+        with self.lock:
+            frame = self.frames.get(index)
+            if frame is not None:
+                self.frames.move_to_end(index)
+            return frame
+
+    def put(self, index, frame) -> None:
+        if frame.nbytes > self.max_bytes:
+            return
+        frame.flags.writeable = False
+        with self.lock:
+            old = self.frames.pop(index, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self.frames[index] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self.lock:
+            self.frames.clear()
+            self.nbytes = 0
 
 
 class VideoReader:
-    def __init__(self, path):
+    def __init__(
+        self,
+        path,
+        cache_bytes: int = FRAME_CACHE_BYTES,
+        readahead: int = READAHEAD_FRAMES,
+    ):
         self.path = path
+        self.index = None
+        self.cache = FrameCache(cache_bytes)
+        self.readahead = readahead
+        self.position = None
+        # The frame at position has already been grabbed and only needs to
+        # be retrieved.
+        self.grabbed = False
+        self.last_requested = None
         self.read_video(self.path)
 
     def read_video(self, path):
@@ -44,38 +116,335 @@ class VideoReader:
     def get_name(self):
         return os.path.splitext(os.path.basename(self.path))[0]
 
+    def get_index(self):
+        if self.index is None:
+            self.index = FrameIndex.load_or_build(self.path)
+        return self.index
+
+    def time_to_frame(self, seconds: float) -> int:
+        return self.get_index().time_to_frame(seconds)
+
+    def grab_frame(self, frame: int) -> bool:
+        index = self.get_index()
+        if not 0 <= frame < len(index):
+            return False
+
+        target = index.pts_msec[frame]
+        key = index.keyframe_before(frame)
+        while True:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, key)
+            if not self.cap.grab():
+                return False
+            pts = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+            if pts <= target + PTS_TOLERANCE_MSEC or key == 0:
+                break
+            key = index.keyframe_before(key - 1)
+
+        while pts < target - PTS_TOLERANCE_MSEC:
+            if not self.cap.grab():
+                return False
+            pts = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        return True
+
+    def seek(self, frame: int) -> bool:
+        if (
+            self.position is not None
+            and self.position < frame
+            and self.get_index().keyframe_before(frame) <= self.position
+        ):
+            while self.position < frame:
+                if self.grabbed:
+                    self.grabbed = False
+                elif not self.cap.grab():
+                    self.position = None
+                    return False
+                self.position += 1
+            return True
+
+        index = self.get_index()
+        self.grabbed = False
+        if frame <= 0:
+            ret = self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        elif frame < len(index) and index.keyframes[frame]:
+            # Grabbing the frame before a keyframe would decode the whole
+            # previous GOP; the keyframe itself is grabbed directly instead.
+            ret = self.grab_frame(frame)
+            self.grabbed = ret
+        else:
+            ret = self.grab_frame(frame - 1)
+        self.position = max(frame, 0) if ret else None
+        return ret
+
+    def decode_next(self):
+        if self.grabbed:
+            self.grabbed = False
+            ret, frame = self.cap.retrieve()
+        else:
+            ret, frame = self.cap.read()
+        if not ret:
+            self.position = None
+            return None
+        self.cache.put(self.position, frame)
+        self.position += 1
+        return frame
+
+    def get_frame(self, frame_index: int):
+        if frame_index < 0:
+            return None
+        sequential = self.last_requested == frame_index - 1
+        self.last_requested = frame_index
+
+        frame = self.cache.get(frame_index)
+        if frame is None:
+            if self.position != frame_index:
+                # Reading on past the packet count is left to the decoder,
+                # but a seek there would land on a clamped frame.
+                if frame_index >= len(self.get_index()):
+                    return None
+                if not self.seek(frame_index):
+                    return None
+            frame = self.decode_next()
+            if frame is None:
+                return None
+
+        if sequential:
+            end = frame_index + 1 + self.readahead
+            if self.position is not None and self.position > frame_index:
+                while self.position is not None and self.position < end:
+                    if self.decode_next() is None:
+                        break
+        return frame
+
+    def get_frames(self, frame_indices):
+        for frame_index in frame_indices:
+            frame = self.get_frame(frame_index)
+            if frame is None:
+                # One frame that fails to decode should not drop every
+                # later index of the request.
+                continue
+            yield frame_index, frame
+
+    def release(self) -> None:
+        self.cap.release()
+        self.cache.clear()
+        self.position = None
+        self.grabbed = False
+
+
+class ImageWriterPool:
+    def __init__(
+        self,
+        num_workers: int = ENCODER_THREADS,
+        queue_size: int = FRAME_QUEUE_SIZE,
+        image_format: ImageFormat = None,
+        rotate_code=None,
+    ):
+        self.image_format = image_format or ImageFormat()
+        self.rotate_code = rotate_code
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.threads = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(max(1, num_workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, frame = item
+            try:
+                if self.rotate_code is not None:
+                    frame = cv2.rotate(frame, self.rotate_code)
+                self.image_format.encode(frame).tofile(path)
+            except Exception as e:
+                self.error = e
+
+    def put(self, path, frame) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put((path, frame))
+
+    def close(self) -> None:
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def plan_chunks(
+    frame_index: FrameIndex,
+    num_chunks: int,
+    start_frame: int = 0,
+    end_frame: int = None,
+):
+    if end_frame is None:
+        end_frame = len(frame_index)
+    start_frame = max(start_frame, 0)
+    end_frame = min(end_frame, len(frame_index))
+    if start_frame >= end_frame:
+        return []
+
+    # Every chunk after the first starts on a keyframe, which seek grabs
+    # directly instead of decoding the previous chunk's last GOP.
+    bounds = {start_frame}
+    for i in range(1, num_chunks):
+        target = start_frame + (end_frame - start_frame) * i // num_chunks
+        keyframe = frame_index.keyframe_before(target)
+        if keyframe > start_frame:
+            bounds.add(keyframe)
+    bounds = sorted(bounds) + [end_frame]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def decode_chunk(
+    video_path: str,
+    output_dir: str,
+    prefix: str,
+    start_frame: int,
+    end_frame: int = None,
+    offset: int = 0,
+    rotate_code=None,
+    num_encoders: int = ENCODER_THREADS,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    image_format: ImageFormat = None,
+) -> int:
+    image_format = image_format or ImageFormat()
+    video_reader = VideoReader(video_path, cache_bytes=0, readahead=0)
+    count = 0
+    with ImageWriterPool(
+        num_encoders, queue_size, image_format, rotate_code
+    ) as writer:
+        if video_reader.seek(start_frame):
+            frame_index = start_frame
+            while end_frame is None or frame_index < end_frame:
+                frame = video_reader.decode_next()
+                if frame is None:
+                    break
+                writer.put(
+                    os.path.join(
+                        output_dir,
+                        f"{prefix}_{frame_index + offset}"
+                        + image_format.extension,
+                    ),
+                    frame,
+                )
+                frame_index += 1
+                count += 1
+    video_reader.release()
+    return count
+
+
+def decode_parallel(
+    video_path: str,
+    output_dir: str,
+    prefix: str,
+    num_chunks: int,
+    start_frame: int = 0,
+    end_frame: int = None,
+    offset: int = 0,
+    rotate_code=None,
+    num_encoders: int = ENCODER_THREADS,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    image_format: ImageFormat = None,
+) -> int:
+    frame_index = FrameIndex.load_or_build(video_path)
+    chunks = plan_chunks(frame_index, num_chunks, start_frame, end_frame)
+    if not chunks:
+        return 0
+    if end_frame is None:
+        # Like the sequential path, the last chunk reads until the decoder
+        # runs out of frames rather than trusting the packet count.
+        chunks[-1] = (chunks[-1][0], None)
+
+    os.makedirs(output_dir, exist_ok=True)
+    # The caller may already run OpenCV and encoder threads, so forking
+    # could copy a held lock into a worker and hang it.
+    with ProcessPoolExecutor(
+        max_workers=len(chunks),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = [
+            executor.submit(
+                decode_chunk,
+                video_path,
+                output_dir,
+                prefix,
+                chunk_start,
+                chunk_end,
+                offset,
+                rotate_code,
+                max(1, num_encoders // len(chunks)),
+                queue_size,
+                image_format,
+            )
+            for chunk_start, chunk_end in chunks
+        ]
+        return sum(future.result() for future in futures)
+
 
 def get_basename(file_path):
     return os.path.splitext(os.path.basename(file_path))[0]
 
 
 def split_video(
-    input_path, output_dir, rotate_direction: str = "None"
+    input_path,
+    output_dir,
+    rotate_direction: str = "None",
+    num_chunks: int = 1,
+    image_format: ImageFormat = None,
 ) -> None:
+    image_format = image_format or ImageFormat()
     video_reader = VideoReader(input_path)
-
-    cap = video_reader.cap
     video_name = video_reader.get_name()
 
     output_dir = os.path.join(output_dir, video_name)
     os.makedirs(output_dir, exist_ok=True)
 
-    while True:
-        ret, frame = cap.read()
-        if ret:
-            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            if rotate_direction == "left":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif rotate_direction == "right":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-            frame_name = f"{video_name}_{frame_index}{SAVE_IMG_EXTENSION}"
-            output_path = os.path.join(output_dir, frame_name)
-            cv2.imwrite(output_path, frame)
-        else:
-            break
+    # This entry point has always rotated the opposite way to the others.
+    rotate_code = {
+        "left": cv2.ROTATE_90_COUNTERCLOCKWISE,
+        "right": cv2.ROTATE_90_CLOCKWISE,
+    }.get(rotate_direction)
+
+    if num_chunks > 1:
+        video_reader.release()
+        decode_parallel(
+            input_path,
+            output_dir,
+            video_name,
+            num_chunks,
+            offset=1,
+            rotate_code=rotate_code,
+            image_format=image_format,
+        )
+        return None
+
+    frames = read_frames(video_reader.cap)
+    frames = rotate_frames(frames, rotate_code)
+    run(
+        frames,
+        [
+            ImageSink(
+                output_dir,
+                lambda i: f"{video_name}_{i + 1}{image_format.extension}",
+                image_format=image_format,
+            )
+        ],
+    )
 
-    cap.release()
+    video_reader.cap.release()
     return None
 
 
@@ -86,49 +455,79 @@ def process_video(
     start_frame: int,
     end_frame: int,
     rotate_direction: str = "none",
-) -> None:
-    cap = video_reader.cap
+    progress=None,
+    cancel_event=None,
+    resized_height: int = None,
+    verbose: bool = True,
+    image_format: ImageFormat = None,
+) -> bool:
+    image_format = image_format or ImageFormat()
     fps = video_reader.get_fps()
-    width, height = video_reader.get_size()
 
     video_dir = os.path.join(base_output_dir, VIDEO_DIR)
     img_dir = os.path.join(base_output_dir, IMG_DIR)
     os.makedirs(video_dir, exist_ok=True)
     os.makedirs(img_dir, exist_ok=True)
 
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     video_output_path = os.path.join(
         video_dir, output_video_name + SAVE_VIDEO_EXTENSION
     )
-    out = cv2.VideoWriter(
-        video_output_path, fourcc, fps, (int(width), int(height))
-    )
-
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-
-            if rotate_direction == "right":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif rotate_direction == "left":
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-            out.write(frame)
-            frame_name = (
-                f"{output_video_name}_{frame_index}{SAVE_IMG_EXTENSION}"
+    def frame_name(frame_index):
+        return f"{output_video_name}_{frame_index + 1}{image_format.extension}"
+
+    image_dirs = [img_dir]
+    sinks = [
+        VideoSink(video_output_path, fps),
+        ImageSink(img_dir, frame_name, image_format=image_format),
+    ]
+    if resized_height is not None:
+        resized_dir = os.path.join(base_output_dir, RESIZED_IMG_DIR)
+        image_dirs.append(resized_dir)
+        sinks.append(
+            ImageSink(
+                resized_dir,
+                frame_name,
+                height=resized_height,
+                image_format=image_format,
+                name="resized images",
             )
-            image_output_path = os.path.join(img_dir, frame_name)
-            cv2.imwrite(image_output_path, frame)
-            if frame_index == end_frame:
-                break
-        else:
-            break
+        )
 
-    cap.release()
-    out.release()
+    start_frame = max(start_frame, 0)
+    total = max(
+        min(end_frame, video_reader.get_frame_count()) - start_frame, 0
+    )
+    # Computed up front so the cleanup below cannot raise a new error of
+    # its own and hide the one that stopped the export.
+    last_frame = min(end_frame, len(video_reader.get_index()))
+    frames = video_reader.get_frames(range(start_frame, end_frame))
+    frames = rotate_frames(frames, ROTATE_CODES.get(rotate_direction))
+    completed = False
+    try:
+        completed = run(
+            frames,
+            sinks,
+            progress=(
+                None if progress is None else lambda n: progress(n, total)
+            ),
+            cancel_event=cancel_event,
+            verbose=verbose,
+        )
+    finally:
+        if not completed:
+            # A cancelled or failed export would otherwise leave files named
+            # exactly like a finished one.
+            paths = [video_output_path]
+            for frame_index in range(start_frame, last_frame):
+                for image_dir in image_dirs:
+                    paths.append(
+                        os.path.join(image_dir, frame_name(frame_index))
+                    )
+            for path in paths:
+                if os.path.isfile(path):
+                    os.remove(path)
+    return completed
 
 
 def reconstruct_video(
@@ -137,27 +536,10 @@ def reconstruct_video(
     start_frame: int,
     end_frame: int,
 ) -> None:
-    cap = video_reader.cap
-    fps = video_reader.get_fps()
-    width, height = video_reader.get_size()
-
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     output_path = output_video_name + SAVE_VIDEO_EXTENSION
-    out = cv2.VideoWriter(output_path, fourcc, fps, (int(width), int(height)))
-
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            out.write(frame)
-            if cap.get(cv2.CAP_PROP_POS_FRAMES) == end_frame:
-                break
-        else:
-            break
-
-    cap.release()
-    out.release()
+    start_frame = max(start_frame, 0)
+    frames = video_reader.get_frames(range(start_frame, end_frame))
+    run(frames, [VideoSink(output_path, video_reader.get_fps())])
     return None
 
 
@@ -166,28 +548,36 @@ def save_frames_as_images(
     output_dir: str,
     start_frame: int,
     end_frame: int,
+    num_chunks: int = 1,
+    image_format: ImageFormat = None,
 ) -> None:
+    image_format = image_format or ImageFormat()
     video_name = video_reader.get_name()
-    os.makedirs(output_dir, exist_ok=True)
-
-    cap = video_reader.cap
-
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            if frame_index > end_frame:
-                break
-
-            frame_name = f"{video_name}_{frame_index}{SAVE_IMG_EXTENSION}"
-            output_path = os.path.join(output_dir, frame_name)
-            cv2.imwrite(output_path, frame)
-        else:
-            break
-
-    cap.release()
+    start_frame = max(start_frame, 0)
+    if num_chunks > 1:
+        decode_parallel(
+            video_reader.path,
+            output_dir,
+            video_name,
+            num_chunks,
+            start_frame,
+            end_frame,
+            offset=1,
+            image_format=image_format,
+        )
+        return
+
+    frames = video_reader.get_frames(range(start_frame, end_frame))
+    run(
+        frames,
+        [
+            ImageSink(
+                output_dir,
+                lambda i: f"{video_name}_{i + 1}{image_format.extension}",
+                image_format=image_format,
+            )
+        ],
+    )
 
 
 def delete_img_dir(img_dir) -> None: